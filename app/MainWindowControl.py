@@ -469,9 +469,10 @@ class MyMainWindow(QMainWindow, Ui_NuMLTool):
             return
 
         print(f"Executing SDS view with YAML: {yaml_file} and SDS: {sds_file}")
-        sds_view.start(['-y', yaml_file, '-s', sds_file])
+        # The plot is saved next to the recording as <recording>.png
+        sds_view.start(['-y', yaml_file, '-s', sds_file, '-o-dir', str(Path(sds_file).parent)])
         # Open the plot dialog with the image path
-        file_path = os.path.join(Path(sds_file).parent, 'myplot.png')
+        file_path = os.path.join(Path(sds_file).parent, f'{Path(sds_file).stem}.png')
         if file_path:
             plot_window = PlotDialog(file_path)
             plot_window.show()
@@ -589,7 +590,9 @@ class MyMainWindow(QMainWindow, Ui_NuMLTool):
         print("Executing SDSIO server")
 
         try:
-            self.thread_a.run = sdsio_server.start([server_type, '-p', serial_port, '--baudrate', baudrate, '--outdir', out_dir])       # 設定該執行緒執行 a()
+            # periodic stream statistics show up in the Recording page log
+            self.thread_a.run = sdsio_server.start([server_type, '-p', serial_port, '--baudrate', baudrate, '--outdir', out_dir,
+                                                    '--stats-interval', '10'])       # 設定該執行緒執行 a()
             self.thread_a.start()       # 啟動執行緒
         except RuntimeError as e:
             # Handle the error gracefully
@@ -598,11 +601,16 @@ class MyMainWindow(QMainWindow, Ui_NuMLTool):
 
     def show_textedit_convert_sdsfile(self):
         """
-        Opens a file dialog to select an SDS file and displays the selected file's path 
+        Opens a file dialog to select an SDS file, or the folder of recordings in batch mode,
+        and displays the selected path
         """
-        # filepath , filetype
-        filepath , _ = QFileDialog.getOpenFileName(
-            directory='sds_out_dir', filter='*.sds')
+        if self.checkBox_batch_2.isChecked():
+            filepath = QFileDialog.getExistingDirectory(
+                self, "Select SDS Recordings Folder", 'sds_out_dir')
+        else:
+            # filepath , filetype
+            filepath , _ = QFileDialog.getOpenFileName(
+                directory='sds_out_dir', filter='*.sds')
         # show file path in textEdit
         self.textEdit_10_sdsF_2.setPlainText(filepath)
         self.textEdit_10_sdsF_2.ensureCursorVisible()
@@ -610,13 +618,24 @@ class MyMainWindow(QMainWindow, Ui_NuMLTool):
     def show_textedit_convert_outfile(self):
         """
         Opens a file dialog to save a file with a specific format based on the selected server type 
-        and displays the selected file path in a text edit widget.
+        and displays the selected file path in a text edit widget. In batch mode an output
+        folder is selected instead.
         """
+        if self.checkBox_batch_2.isChecked():
+            folderpath = QFileDialog.getExistingDirectory(self, "Select Output Folder", "")
+            self.textEdit_8_outDir_2.setPlainText(folderpath)
+            self.textEdit_8_outDir_2.ensureCursorVisible()
+            return
+
         openfile_format = "Text Files (*.txt)"
         if self.comboBox_serverType_convertFormat_2.currentText() == "simple_csv":
             openfile_format = "CSV Files (*.csv)"
         elif self.comboBox_serverType_convertFormat_2.currentText() == "audio_wav":
             openfile_format = "WAV Files (*.wav)"
+        elif self.comboBox_serverType_convertFormat_2.currentText() == "simple_npy":
+            openfile_format = "NPY Files (*.npy)"
+        elif self.comboBox_serverType_convertFormat_2.currentText() == "simple_parquet":
+            openfile_format = "Parquet Files (*.parquet)"
 
         filepath, _ = QFileDialog.getSaveFileName(
             self,
@@ -654,18 +673,43 @@ class MyMainWindow(QMainWindow, Ui_NuMLTool):
             print("Error: Missing convert configuration parameters.")
             return
 
+        # NPY/Parquet output has no class label and cannot be exported to Edge Impulse
+        if convert_format in sds_convert.COLUMNAR_FORMATS:
+            if ei_export_enable:
+                print(f"Error: Edge Impulse export is not supported by {convert_format}.")
+                return
+            label_args = []
+        else:
+            label_args = ['--label', label]
+
+        # A folder of recordings is converted in batch mode, out_file is then the output folder
+        if self.checkBox_batch_2.isChecked() or os.path.isdir(sds_file):
+            if not os.path.isdir(sds_file):
+                print(f"Error: Batch convert needs a folder of SDS recordings: {sds_file}")
+                return
+            print("Executing SDS batch convert")
+            convert_args = ['batch', '-f', convert_format, '-i', sds_file, '-o', out_file, '-y', yaml_file,
+                            '--normalize'] + label_args
+            if ei_export_enable:
+                convert_args.append('--ei-export')
+            try:
+                sds_convert.start(convert_args)
+            except RuntimeError as e:
+                print(f"Error in thread: {e}")
+            return
+
         if ei_export_enable:
             print("Executing SDS convert with EI export enabled")
             try:
                 sds_convert.start([convert_format, '-i', sds_file, '-o', out_file, '-y', yaml_file,
-                                '--normalize', '--label', label, '--ei-export'])
+                                '--normalize'] + label_args + ['--ei-export'])
             except RuntimeError as e:
                 print(f"Error in thread: {e}")
         else:
             print("Executing SDS convert")
             try:
                 sds_convert.start([convert_format, '-i', sds_file, '-o', out_file, '-y', yaml_file,
-                                '--normalize', '--label', label])
+                                '--normalize'] + label_args)
             except RuntimeError as e:
                 print(f"Error in thread: {e}")
 
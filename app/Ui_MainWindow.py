@@ -735,6 +735,8 @@ class Ui_NuMLTool(object):
         self.comboBox_serverType_convertFormat_2.setObjectName("comboBox_serverType_convertFormat_2")
         self.comboBox_serverType_convertFormat_2.addItem("")
         self.comboBox_serverType_convertFormat_2.addItem("")
+        self.comboBox_serverType_convertFormat_2.addItem("")
+        self.comboBox_serverType_convertFormat_2.addItem("")
         self.horizontalLayout_6.addWidget(self.comboBox_serverType_convertFormat_2)
         self.horizontalLayout_6.setStretch(0, 2)
         self.horizontalLayout_6.setStretch(1, 1)
@@ -807,6 +809,20 @@ class Ui_NuMLTool(object):
         self.label_28.setWordWrap(True)
         self.label_28.setObjectName("label_28")
         self.gridLayout_5.addWidget(self.label_28, 0, 0, 1, 1)
+        self.checkBox_batch_2 = QtWidgets.QCheckBox(self.groupBox_14)
+        sizePolicy = QtWidgets.QSizePolicy(QtWidgets.QSizePolicy.Expanding, QtWidgets.QSizePolicy.Expanding)
+        sizePolicy.setHorizontalStretch(0)
+        sizePolicy.setVerticalStretch(0)
+        sizePolicy.setHeightForWidth(self.checkBox_batch_2.sizePolicy().hasHeightForWidth())
+        self.checkBox_batch_2.setSizePolicy(sizePolicy)
+        font = QtGui.QFont()
+        font.setPointSize(8)
+        self.checkBox_batch_2.setFont(font)
+        self.checkBox_batch_2.setStyleSheet("border: 3px solid;\n"
+"border-radius: 0px;\n"
+"border-color: rgb(200, 200, 200);")
+        self.checkBox_batch_2.setObjectName("checkBox_batch_2")
+        self.gridLayout_5.addWidget(self.checkBox_batch_2, 0, 1, 1, 1)
         self.pushButton_5_sdsF_2 = QtWidgets.QPushButton(self.groupBox_14)
         sizePolicy = QtWidgets.QSizePolicy(QtWidgets.QSizePolicy.Preferred, QtWidgets.QSizePolicy.Preferred)
         sizePolicy.setHorizontalStretch(0)
@@ -820,7 +836,7 @@ class Ui_NuMLTool(object):
 "border-radius: 0px;\n"
 "border-color: rgb(200, 200, 200);")
         self.pushButton_5_sdsF_2.setObjectName("pushButton_5_sdsF_2")
-        self.gridLayout_5.addWidget(self.pushButton_5_sdsF_2, 0, 1, 1, 1)
+        self.gridLayout_5.addWidget(self.pushButton_5_sdsF_2, 0, 2, 1, 1)
         self.textEdit_10_sdsF_2 = QtWidgets.QTextEdit(self.groupBox_14)
         sizePolicy = QtWidgets.QSizePolicy(QtWidgets.QSizePolicy.Expanding, QtWidgets.QSizePolicy.Ignored)
         sizePolicy.setHorizontalStretch(0)
@@ -834,9 +850,10 @@ class Ui_NuMLTool(object):
 "border-radius: 0px;\n"
 "border-color: rgb(200, 200, 200);")
         self.textEdit_10_sdsF_2.setObjectName("textEdit_10_sdsF_2")
-        self.gridLayout_5.addWidget(self.textEdit_10_sdsF_2, 1, 0, 1, 2)
+        self.gridLayout_5.addWidget(self.textEdit_10_sdsF_2, 1, 0, 1, 3)
         self.gridLayout_5.setColumnStretch(0, 3)
-        self.gridLayout_5.setColumnStretch(1, 2)
+        self.gridLayout_5.setColumnStretch(1, 1)
+        self.gridLayout_5.setColumnStretch(2, 2)
         self.gridLayout_5.setRowStretch(0, 1)
         self.gridLayout_5.setRowStretch(1, 3)
         self.verticalLayout_9.addWidget(self.groupBox_14)
@@ -2117,9 +2134,13 @@ class Ui_NuMLTool(object):
         self.label_26.setText(_translate("NuMLTool", "Convert Format"))
         self.comboBox_serverType_convertFormat_2.setItemText(0, _translate("NuMLTool", "simple_csv"))
         self.comboBox_serverType_convertFormat_2.setItemText(1, _translate("NuMLTool", "audio_wav"))
+        self.comboBox_serverType_convertFormat_2.setItemText(2, _translate("NuMLTool", "simple_npy"))
+        self.comboBox_serverType_convertFormat_2.setItemText(3, _translate("NuMLTool", "simple_parquet"))
         self.label_27.setText(_translate("NuMLTool", "Edge Impulse Format & Export"))
         self.checkBox_EI_2.setText(_translate("NuMLTool", "Enable"))
         self.label_28.setText(_translate("NuMLTool", "Input SDS Data Recording File"))
+        self.checkBox_batch_2.setToolTip(_translate("NuMLTool", "Convert all recordings of a folder into an output folder"))
+        self.checkBox_batch_2.setText(_translate("NuMLTool", "Batch"))
         self.pushButton_5_sdsF_2.setText(_translate("NuMLTool", "Choose"))
         self.label_29.setText(_translate("NuMLTool", "Output File Name"))
         self.pushButton_outDir_2.setText(_translate("NuMLTool", "Choose"))
@@ -1,6 +1,7 @@
 __version__ = "0.1.0"
-__all__ = ['sds_convert', 'sds_view', 'sdsio_server', 'flash_fw']
+__all__ = ['sds_file', 'sds_convert', 'sds_view', 'sdsio_server', 'flash_fw']
 
+from .sds_file import *
 from .sds_convert import *
 from .sds_view import *
 from .sdsio_server import *
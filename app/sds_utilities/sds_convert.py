@@ -17,19 +17,27 @@
 # Python SDS Data Converter
 
 import argparse
+import contextlib
 import csv
+import glob
+import hashlib
+import io
 import json
 import sys
 import os
+import time
 import requests
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain
 from pathlib import Path
-import wave
-from struct import calcsize, unpack
+from struct import pack
 
 import numpy as np
 import pandas as pd
 import yaml
 
+from .sds_file import SdsFile, getDataType, getContentDtype, decodeData, decodeChunks, setWorkerExecutable
+
 # Edit to your Edge Impulse project API key
 with open('API_Key.txt', 'r', encoding='utf-8') as file:
     EI_API_KEY = file.readline().strip()
@@ -63,75 +71,55 @@ def ingestion_edgeimpulse(file):
         print(f"ConnectionError occurred: {e}")        
 
 
-class RecordManager:
-    def __init__(self):
-        self.HEADER_SIZE = 8
-        self.TIMESTAMP_SIZE = 4
-        self.data_buff = bytearray()
-        self.timestamp = []
-        self.data_size = []
-
-    # Flush data buffer
-    def __flush(self):
-        self.data_buff = bytearray()
-        self.timestamp = []
-        self.data_size = []
-
-    # Private function for retrieving data from record
-    def __getRecord(self, file):
-        record = bytearray(file.read(self.HEADER_SIZE))
-        if len(record) == self.HEADER_SIZE:
-            self.timestamp.append(unpack("I", record[:self.TIMESTAMP_SIZE])[0])
-            self.data_size.append(unpack("I", record[self.TIMESTAMP_SIZE:])[0])
-            self.data_buff.extend(bytearray(file.read(self.data_size[-1])))
-
-    # Extract all data from .sds recording and return a dictionary
-    # Dictionary consists of: timestamp, data_size, raw_data
-    def getData(self, file):
-        record_num = 0
+# Number of CSV rows formatted and written at once
+CSV_BLOCK_SIZE = 65536
 
-        while True:
-            self.__getRecord(file)
-            if len(self.timestamp) == record_num:
-                break
-            else:
-                record_num += 1
+# Default number of SDS records decoded at once in streaming conversion
+CHUNK_RECORDS = 4096
+
+# WAV header: RIFF chunk with 'fmt ' subchunk for PCM data, followed by 'data' subchunk header
+WAVE_FORMAT_PCM = 0x0001
+WAVE_HEADER_SIZE = 44
+
+# Output buffer of WAV file, record payloads are collected here before they are written to disk
+WAVE_BUFFER_SIZE = 1024 * 1024
+
+# Conversion manifest kept next to output files, used to skip up to date conversions
+MANIFEST_NAME = "sds_convert.manifest.json"
+MANIFEST_VERSION = 1
+
+# Conversion options that change the output files
+MANIFEST_PARAMS = ("normalize", "ei_export", "label", "start_timestamp", "stop_timestamp", "interval")
 
-        data = {"timestamp": self.timestamp,
-                "data_size": self.data_size,
-                "raw_data": self.data_buff}
+# Number of bytes read at once when hashing input files
+HASH_BLOCK_SIZE = 1024 * 1024
 
-        self.__flush()
+# SDS record payload of Qeexo sensors: data type and number of values of one sample.
+# Other sensors are written as timestamps only.
+QEEXO_SDS_SAMPLES = {'accel': ('<i2', 3),
+                     'gyro': ('<i2', 3),
+                     'magno': ('<i2', 3),
+                     'temperature': ('<i2', 1),
+                     'humidity': ('<i2', 1),
+                     'microphone': ('<i2', 1),
+                     'pressure': ('<i4', 1)}
 
-        return data
+# Duration of one Qeexo CSV row, in ms
+QEEXO_ROW_DURATION = 50
 
+# Number of Qeexo CSV rows (intervals) resampled at once
+QEEXO_BLOCK_ROWS = 1024
+
+# Columnar output formats with the same rows as simple CSV and their file extension
+COLUMNAR_FORMATS = {"simple_npy": "npy", "simple_parquet": "parquet"}
+
+# Output file extension of each format supported by batch conversion
+BATCH_FORMATS = {"simple_csv": "csv", "audio_wav": "wav", **COLUMNAR_FORMATS}
 
 # Potential AutoML CSV V2 columns that are not sensors, and so should be ignored.
 EXCLUDE_QX_CSVV2_COLS = ('timestamp', 'index', 'event', 'label',
                          'data_type', 'seconds', 'recording_id', 'event_id')
 
-# Convert C style data type to Python style
-
-
-def getDataType(data_type):
-    if data_type == "int16_t":
-        d_type = "h"
-    elif data_type == "uint16_t":
-        d_type = "H"
-    elif data_type == "int32_t":
-        d_type = "i"
-    elif data_type == "uint32_t":
-        d_type = "I"
-    elif data_type == "float":
-        d_type = "f"
-    elif data_type == "double":
-        d_type = "d"
-    else:
-        print(f"Unknown data type: {data_type}\n")
-        d_type = "I"
-
-    return d_type
-
 # Select correct Qeexo sensor data name
 
 
@@ -202,67 +190,192 @@ def createCSV(filename):
     except Exception as e:
         sys.exit(f"Error in createCSV(): {e}")
 
-# Open CSV file and create writer
+# Open WAV file for writing
 
 
 def createWAV(filename):
     global wave_file
 
     try:
-        wave_file = wave.open(f"{filename}.wav", "wb")
+        wave_file = open(f"{filename}.wav", "wb", buffering=WAVE_BUFFER_SIZE)
     except Exception as e:
         sys.exit(f"Error in createWAV(): {e}")
 
 
-def prepareData(meta_data, raw_data, data_manipulation):
-    sensor_data = []
-    desc_n_max = len(meta_data)
-    desc_n = 0
-    for channel in meta_data:
-        tmp_data = []
-        # Extract channel data type information from YAML file
-        d_type = getDataType(channel["type"])
-        # Calculate number of bytes needed for decoding the data in .sds file
-        d_byte = calcsize(d_type)
-        # Disunite raw data into a list of data points according to the number
-        # of bytes needed for each data point
-        tmp_data = [raw_data[i:(i + d_byte)]
-                    for i in range(0, len(raw_data), d_byte)]
-        # Keep only every n-th data point
-        tmp_data = tmp_data[desc_n::desc_n_max]
-        # Decode retrieved data points
-        tmp_data = list(
-            unpack(f"{int(len(tmp_data))}{d_type}", b''.join(tmp_data)))
-        # Scale and offset data points if output format is not Qeexo V2 CSV
-        if data_manipulation == True:
-            if "scale" in channel:
-                scale = channel["scale"]
-            else:
-                scale = 1
-            if "offset" in channel:
-                offset = channel["offset"]
-            else:
-                offset = 0
-            data = [((x * scale) + offset) for x in tmp_data]
-        else:
-            data = tmp_data
-        # Store decoded data in a dictionary
-        sensor_data.append(data)
-        # Increment channel description number
-        desc_n += 1
-
-    return sensor_data
-
-# Write data to CSV file, simple format
+# Create RIFF/WAVE header for PCM audio with data_size bytes of sample data
+def waveHeader(n_channels, sample_width, framerate, data_size):
+    return pack('<4sL4s4sLHHLLHH4sL',
+                b'RIFF', 36 + data_size, b'WAVE', b'fmt ', 16,
+                WAVE_FORMAT_PCM, n_channels, framerate,
+                n_channels * framerate * sample_width,
+                n_channels * sample_width,
+                sample_width * 8, b'data', data_size)
+
+
+# Write rows to CSV file in large blocks.
+# Columns are converted to Python numbers per block so the csv module formats
+# them exactly like single writerow calls would.
+def writeCSVColumns(timestamp, channel_data):
+    for start in range(0, len(timestamp), CSV_BLOCK_SIZE):
+        block = slice(start, start + CSV_BLOCK_SIZE)
+        writer.writerows(zip(timestamp[block].tolist(),
+                             *[channel[block].tolist() for channel in channel_data]))
+
+
+# Timestamps of records [start, stop) in seconds, relative to timestamp_base
+def recordTimestamps(sds, start, stop, timestamp_base):
+    timestamp = sds.timestamp[start:stop] / 1000
+    if timestamp_base is not None:
+        timestamp -= timestamp_base
+
+    return timestamp
+
+
+# Timestamp following the final record of the file. Reuses the time difference
+# to the last record before it that holds more than one sample.
+def finalTimestamp(sds, n_samples, timestamp_base):
+    n_records = len(n_samples)
+    multi = np.flatnonzero(n_samples[:-1] > 1)
+    previous = int(multi[-1]) if len(multi) > 0 else max(n_records - 2, 0)
+    timestamp_previous, timestamp_last = recordTimestamps(
+        sds, previous, n_records, timestamp_base)[[0, -1]]
+
+    return timestamp_last + (timestamp_last - timestamp_previous)
+
+
+# Calculate CSV timestamps of all samples in a chunk of records, interpolated
+# between record timestamps. Returns sample timestamps, mask of samples to write,
+# and number of records converted before a single sample record past the stop
+# timestamp ends the conversion.
+def interpolateTimestamps(timestamp, timestamp_next, n_samples, csv_start_timestamp, csv_stop_timestamp):
+    n_records = len(timestamp)
+
+    # Interpolate timestamps between current and next record, based on the number of
+    # data points in current record. Same arithmetic as np.linspace() per record.
+    step = np.zeros(n_records)
+    multi = n_samples > 1
+    step[multi] = (timestamp_next[multi] - timestamp[multi]) / n_samples[multi]
+    record_start = np.cumsum(n_samples) - n_samples
+    sample_idx = np.arange(int(n_samples.sum())) - np.repeat(record_start, n_samples)
+    sample_timestamp = sample_idx * np.repeat(step, n_samples) + np.repeat(timestamp, n_samples)
+
+    # If start/stop timestamp parameters are specified, write to output file
+    # when timestamps are between selected boundaries
+    write = np.ones(len(sample_timestamp), dtype=bool)
+    if csv_start_timestamp is not None:
+        write &= sample_timestamp >= csv_start_timestamp
+    if csv_stop_timestamp is not None:
+        stop = write & (sample_timestamp >= csv_stop_timestamp)
+        # A single sample record past the stop timestamp ends the conversion,
+        # inside a record with more samples only the rest of the record is dropped
+        stop_record = np.flatnonzero(stop[record_start] & (n_samples == 1))
+        if len(stop_record) > 0:
+            n_records = int(stop_record[0])
+        stop_cnt = np.cumsum(stop) - stop
+        stop_before = stop_cnt - np.repeat(stop_cnt[record_start], n_samples)
+        write &= ~stop & (stop_before == 0)
+
+    n_written = int(n_samples[:n_records].sum())
+    return sample_timestamp[:n_written], write[:n_written], n_records
+
+
+# Rows of the simple formats (one timestamp column and one column per channel)
 # Only supports one sensor at a time
-
-
-def write_SDS_SimpleCSV(args, data, meta_data, sensor_frequency):
+# Records are decoded in chunks of args.chunk_records records through the SDS
+# record index, so memory use does not depend on the length of the recording.
+# Yields (timestamp, channel_data) for consecutive blocks of rows. Without
+# decode, channel_data is None and no payload is read, which counts the rows.
+def simpleRows(args, sds, meta_data, sensor_frequency, decode=True):
     normalize = args.normalize
     csv_start_timestamp = args.start_timestamp
     csv_stop_timestamp = args.stop_timestamp
-    use_meta_freq = args.ei_export
+    use_meta_freq = getattr(args, "ei_export", False)
+    chunk_records = args.chunk_records
+
+    def chunks(start=0, stop=None):
+        if decode:
+            return decodeChunks(sds, meta_data, chunk_records, start=start, stop=stop)
+        return ((chunk_start, chunk_stop, None) for chunk_start, chunk_stop in
+                sds.chunks(chunk_records, start, stop))
+
+    # Number of complete samples in each record
+    frame_size = getContentDtype(meta_data).itemsize
+    n_samples = sds.data_size // frame_size
+
+    # Conversion ends at the first record without data
+    empty = np.flatnonzero(n_samples == 0)
+    n_records = int(empty[0]) if len(empty) > 0 else len(n_samples)
+
+    if use_meta_freq:
+        # get metadata frequency
+        freq = sensor_frequency
+        time_interval = (1 / freq) * 1000  # (ms)
+
+        # Time counter starts at 0 and only advances for written rows
+        if (csv_start_timestamp is not None) and (csv_start_timestamp > 0):
+            n_records = 0
+        time_cnt = None
+
+        # Skip first packet
+        for start, stop, channel_data in chunks(start=1, stop=n_records):
+            n_rows = int(n_samples[start:stop].sum(dtype=np.int64))
+            chunk_time = np.full(n_rows, time_interval)
+            chunk_time[0] = 0 if time_cnt is None else time_cnt + time_interval
+            chunk_time = np.cumsum(chunk_time)
+            time_cnt = float(chunk_time[-1])
+
+            n_write = n_rows
+            if csv_stop_timestamp is not None:
+                n_write = int(np.count_nonzero(chunk_time < csv_stop_timestamp))
+            if channel_data is not None:
+                channel_data = [channel[:n_write] for channel in channel_data]
+            yield chunk_time[:n_write], channel_data
+            if n_write < n_rows:
+                break
+    else:
+        # Convert [ms] to [s] and normalize output timestamps
+        timestamp_base = None
+        if normalize == True and len(sds) > 0:
+            timestamp_base = sds.timestamp[0] / 1000
+
+        # Seek to the records covering the start/stop timestamp window, widened by
+        # one record on each side so the conversion to seconds cannot cut it short
+        first = 0
+        base_ms = 0 if timestamp_base is None else timestamp_base * 1000
+        if csv_start_timestamp is not None or csv_stop_timestamp is not None:
+            first, last = sds.findRecords(
+                None if csv_start_timestamp is None else csv_start_timestamp * 1000 + base_ms,
+                None if csv_stop_timestamp is None else csv_stop_timestamp * 1000 + base_ms)
+            first = max(first - 1, 0)
+            n_records = min(n_records, last + 1)
+
+        for start, stop, channel_data in chunks(start=first, stop=n_records):
+            # Timestamps of records in this chunk and of the record following each of them
+            timestamp = recordTimestamps(sds, start, stop + 1, timestamp_base)
+            timestamp_next = timestamp[1:]
+            if stop == len(sds):
+                timestamp_next = np.append(timestamp_next, finalTimestamp(sds, n_samples, timestamp_base))
+
+            sample_timestamp, write, n_converted = interpolateTimestamps(
+                timestamp[:stop - start], timestamp_next, n_samples[start:stop].astype(np.int64),
+                csv_start_timestamp, csv_stop_timestamp)
+
+            if channel_data is not None:
+                channel_data = [channel[:len(write)][write] for channel in channel_data]
+            yield sample_timestamp[write], channel_data
+            if n_converted < stop - start:
+                break
+
+
+# Data type of one row of the simple formats: timestamp and decoded channels
+def simpleDtype(meta_data):
+    channel_data = decodeData(b"", meta_data)
+    return np.dtype([("timestamp", "<f8")] +
+                    [(channel["value"], data.dtype) for channel, data in zip(meta_data, channel_data)])
 
+
+# Write data to CSV file, simple format
+def write_SDS_SimpleCSV(args, sds, meta_data, sensor_frequency):
     # Automatically generate new column for each sensor channel
     csv_header = ['timestamp']
     for channel in meta_data:
@@ -272,106 +385,115 @@ def write_SDS_SimpleCSV(args, data, meta_data, sensor_frequency):
     # Write header to CSV file
     writer.writerow(csv_header)
 
-    # Convert [ms] to [s]
-    timestamp = [t / 1000 for t in data["timestamp"]]
-    data_size = data["data_size"]
+    for timestamp, channel_data in simpleRows(args, sds, meta_data, sensor_frequency):
+        writeCSVColumns(timestamp, channel_data)
 
-    cnt = 0
-    cnt_max = len(timestamp)
+    csv_file.close()
 
-    # get metadata frequency
-    freq = sensor_frequency
-    time_interval = (1 / freq) * 1000  # (ms)
-    time_cnt = 0
-    skip_first_packet = True
 
-    while True:
-        # Break while loop if end of file is reached
-        if cnt == cnt_max:
-            break
+# Write data to NPY file as a structured array with a typed field per column.
+# Rows are counted from the record index first, so the NPY header can be written
+# before the rows are appended chunk by chunk. The file can be memory mapped with
+# np.load(mmap_mode='r').
+def write_SDS_SimpleNPY(args, sds, meta_data, sensor_frequency, filename):
+    n_rows = sum(len(timestamp) for timestamp, _ in
+                 simpleRows(args, sds, meta_data, sensor_frequency, decode=False))
+    d_type = simpleDtype(meta_data)
+    try:
+        with open(filename, "wb") as npy_file:
+            np.lib.format.write_array_header_1_0(npy_file, {"descr": np.lib.format.dtype_to_descr(d_type),
+                                                            "fortran_order": False,
+                                                            "shape": (n_rows,)})
+            for timestamp, channel_data in simpleRows(args, sds, meta_data, sensor_frequency):
+                block = np.empty(len(timestamp), dtype=d_type)
+                block["timestamp"] = timestamp
+                for channel, data in zip(meta_data, channel_data):
+                    block[channel["value"]] = data
+                block.tofile(npy_file)
+    except OSError as e:
+        sys.exit(f"Error in write_SDS_SimpleNPY(): {e}")
+
+
+# Write data to Parquet file, one row group per chunk of records.
+# Needs the optional pyarrow package.
+def write_SDS_SimpleParquet(args, sds, meta_data, sensor_frequency, filename):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        sys.exit("Parquet file format requires the pyarrow package (pip install pyarrow)")
 
-        # Create a list of lists, based on the number of channels
-        record_row = [[] for i in range(0, len(meta_data))]
-
-        # Extract needed data and flush used bytes from buffer
-        raw_data = data["raw_data"][:data_size[cnt]]
-        data["raw_data"] = data["raw_data"][data_size[cnt]:]
-
-        # Convert raw data according to description in meta data
-        record_row = prepareData(meta_data, raw_data, data_manipulation=True)
-
-        # Prepare and write CSV row to output file if record_row is not empty
-        if record_row != [[] for i in range(0, len(meta_data))]:
-            if use_meta_freq:
-                if cnt == 0 and skip_first_packet:
-                    cnt += 1
-                    continue
-                for idx, _ in enumerate(record_row[0]):
-                    if (csv_start_timestamp is None) or (time_cnt >= csv_start_timestamp):
-                        if (csv_stop_timestamp is None) or (csv_stop_timestamp > time_cnt):
-                            tmp_record_row = [record_row[i][idx]
-                                              for i in range(len(record_row))]
-                            writer.writerow(
-                                [float(time_cnt)] + tmp_record_row)
-
-                            time_cnt += time_interval
-                        else:
-                            break
-                cnt += 1
-            else:
-                csv_timestamp = timestamp[cnt]
-                # Normalize output timestamps
-                if normalize == True:
-                    csv_timestamp -= timestamp[0]
-                # Interpolate timestamps if there is more than one data point in this record
-                if len(record_row[0]) > 1:
-                    # Get number of samples in this record
-                    n_samples = len(record_row[0])
-
-                    # Reuse previous time difference to interpolate timestamps for final record
-                    if cnt == (cnt_max-1):
-                        csv_timestamp_next = csv_timestamp + \
-                            (csv_timestamp - csv_timestamp_previous)
-                    else:
-                        csv_timestamp_next = timestamp[cnt + 1]
-                        if normalize == True:
-                            csv_timestamp_next -= timestamp[0]
-
-                    # Interpolate timestamps between current and next record, based on the number of
-                    # data points in current record
-                    tmp_time = np.linspace(
-                        csv_timestamp, csv_timestamp_next,  n_samples + 1)[:-1]
-                    csv_timestamp_previous = csv_timestamp
-
-                    # Write generated CSV row to output file
-                    for t in range(0, len(tmp_time)):
-                        # If start/stop timestamp parameters are specified, write to output file
-                        # when timestamps are between selected boundaries
-                        if (csv_start_timestamp == None) or (tmp_time[t] >= csv_start_timestamp):
-                            if (csv_stop_timestamp == None) or (csv_stop_timestamp > tmp_time[t]):
-                                tmp_record_row = [record_row[i][t]
-                                                  for i in range(len(record_row))]
-                                writer.writerow(
-                                    [float(tmp_time[t])] + tmp_record_row)
-                            else:
-                                break
-                else:
-                    # If start/stop timestamp parameters are specified, write to output file
-                    # when timestamps are between selected boundaries
-                    if (csv_start_timestamp == None) or (csv_timestamp >= csv_start_timestamp):
-                        if (csv_stop_timestamp == None) or (csv_stop_timestamp > csv_timestamp):
-                            # Write generated CSV row to output file
-                            writer.writerow(
-                                [float(csv_timestamp)] + record_row[0])
-                        else:
-                            break
-                cnt += 1
-        else:
-            break
-    csv_file.close()
+    d_type = simpleDtype(meta_data)
+    schema = pa.schema([(name, pa.from_numpy_dtype(d_type[name])) for name in d_type.names])
+    try:
+        with pq.ParquetWriter(filename, schema) as parquet_writer:
+            for timestamp, channel_data in simpleRows(args, sds, meta_data, sensor_frequency):
+                if len(timestamp) > 0:
+                    parquet_writer.write_table(pa.Table.from_arrays([timestamp] + channel_data, schema=schema))
+    except OSError as e:
+        sys.exit(f"Error in write_SDS_SimpleParquet(): {e}")
+
+
+# Record cursor after each interval: index of the first record at or after the
+# cursor with a timestamp not less than the interval end timestamp. Sorted
+# timestamps are searched at once, others are scanned one record at a time.
+def intervalBoundaries(timestamp, is_sorted, interval_end, cursor):
+    if is_sorted:
+        return np.searchsorted(timestamp, interval_end, side="left")
+
+    boundaries = np.empty(len(interval_end), dtype=np.int64)
+    n_records = len(timestamp)
+    for n, csv_timestamp in enumerate(interval_end.tolist()):
+        if cursor < n_records:
+            while timestamp[cursor] < csv_timestamp:
+                cursor += 1
+                if cursor == n_records:
+                    break
+        boundaries[n] = cursor
+
+    return boundaries
+
+
+# Qeexo CSV cells of one sensor for intervals between consecutive record
+# boundaries. A cell lists the samples of all records in the interval, grouped
+# into a list per sample if the sensor has more than one channel.
+def qeexoCells(sds, content, boundaries):
+    first = int(boundaries[0])
+    last = int(boundaries[-1])
+    frame_size = getContentDtype(content).itemsize
+    sizes = sds.data_size[first:last].astype(np.int64)
+
+    # Records without partial samples are decoded at once and sliced per interval
+    if np.all(sizes % frame_size == 0):
+        channels = [channel.tolist() for channel in
+                    decodeData(sds.readData(first, last), content, data_manipulation=False)]
+        samples = []
+        if len(channels) > 1:
+            samples = [list(sample) for sample in zip(*channels)]
+        elif len(channels) == 1:
+            samples = channels[0]
+        sample_offset = np.concatenate(([0], np.cumsum(sizes // frame_size)))[boundaries - first].tolist()
+        return [str(samples[start:stop]) for start, stop in zip(sample_offset[:-1], sample_offset[1:])]
+
+    # Otherwise payloads of each interval are joined and decoded on their own
+    cells = []
+    for start, stop in zip(boundaries[:-1].tolist(), boundaries[1:].tolist()):
+        channels = [channel.tolist() for channel in
+                    decodeData(sds.readData(start, stop), content, data_manipulation=False)]
+        samples = []
+        if len(channels) > 1:
+            samples = [list(sample) for sample in zip(*channels)]
+        elif len(channels) == 1:
+            samples = channels[0]
+        cells.append(str(samples))
+
+    return cells
 
 
 # Write data to CSV file using Qeexo V2 format
+# Rows are resampled in blocks of QEEXO_BLOCK_ROWS intervals. Record boundaries
+# of all intervals in a block are searched at once in the timestamps of each
+# sensor, and the decoded samples are sliced per interval.
 def write_SDS_QeexoV2CSV(args, data, meta_data):
     interval = args.interval
     normalize = args.normalize
@@ -386,167 +508,545 @@ def write_SDS_QeexoV2CSV(args, data, meta_data):
 
     writer.writerow(csv_header)
 
-    # Set sensor position counters to 0 and extract base timestamps for each sensor
-    cnt = {}
-    cnt_old = {}
+    # Set sensor record cursors to 0 and extract base timestamps for each sensor
+    sensors = list(data)
+    cursor = {}
+    sensor_timestamp = {}
+    is_sorted = {}
     timestamp_base = []
-    for sensor in data:
-        cnt_old[sensor] = 0
-        cnt[sensor] = 0
-        timestamp_base.append(data[sensor]["timestamp"][0])
+    for sensor in sensors:
+        cursor[sensor] = 0
+        sensor_timestamp[sensor] = data[sensor].timestamp.astype(np.int64)
+        is_sorted[sensor] = bool(np.all(np.diff(sensor_timestamp[sensor]) >= 0))
+        timestamp_base.append(int(sensor_timestamp[sensor][0]))
 
     # Select timestamp with lowest value and round to first next interval
     csv_timestamp_base = (min(timestamp_base) // interval) * interval
-    csv_timestamp = csv_timestamp_base + interval
 
-    while True:
-        # Create a list of lists, based on the number of sensors
-        csv_row = [[] for i in range(0, len(data.keys()))]
-        sensor_idx = 0
-
-        for sensor in data:
-            timestamp = data[sensor]["timestamp"]
-            data_size = data[sensor]["data_size"]
-
-            # Check if end of file is reached. If it is, skip current sensor
-            # Otherwise store current position counter in cnt_old
-            if cnt[sensor] < len(timestamp):
-                cnt_old[sensor] = cnt[sensor]
-            else:
-                continue
-
-            # Increment position counter of this sensor if elapsed time in record
-            # is less than next CSV timestamp
-            while timestamp[cnt[sensor]] < csv_timestamp:
-                cnt[sensor] += 1
-                # Break while loop if end of file is reached
-                if cnt[sensor] == len(timestamp):
-                    break
+    # Rows are formatted directly: timestamps are integers and cells only need
+    # quoting when they contain a comma. The label is formatted by the CSV writer.
+    label_csv = io.StringIO()
+    csv.writer(label_csv).writerow(['', args.label])
+    label_field = label_csv.getvalue()
+
+    row_idx = 0
+    done = False
+    while not done:
+        # End timestamps of the intervals in this block
+        csv_timestamp = csv_timestamp_base + interval * np.arange(
+            row_idx + 1, row_idx + QEEXO_BLOCK_ROWS + 1, dtype=np.int64)
+
+        cells = []
+        at_end = []
+        for sensor in sensors:
+            boundaries = intervalBoundaries(sensor_timestamp[sensor], is_sorted[sensor],
+                                            csv_timestamp, cursor[sensor])
+            boundaries = np.concatenate(([cursor[sensor]], boundaries))
+            # Sensors at the end of file are left out of the row
+            at_end.append((boundaries[:-1] == len(sensor_timestamp[sensor])).tolist())
+            cells.append(qeexoCells(data[sensor], meta_data[sensor], boundaries))
+            cursor[sensor] = int(boundaries[-1])
+
+        lines = []
+        for n, timestamp in enumerate(csv_timestamp.tolist()):
+            # Sensors at end of file are skipped, the following sensors move up one column
+            csv_row = [cells[i][n] for i in range(len(sensors)) if not at_end[i][n]]
+            csv_row += ['[]'] * (len(sensors) - len(csv_row))
+
+            # If there is no data present in this row, stop without writing it
+            if all(cell == '[]' for cell in csv_row):
+                done = True
+                break
 
-            # Calculate number of data bytes for current timestamp
-            n_bytes = sum(data_size[cnt_old[sensor]:cnt[sensor]])
-
-            # Extract needed data and flush used bytes from buffer
-            raw_data = data[sensor]["raw_data"][:n_bytes]
-            data[sensor]["raw_data"] = data[sensor]["raw_data"][n_bytes:]
-
-            # Convert raw data according to description in meta data
-            sensor_data = prepareData(
-                meta_data[sensor], raw_data, data_manipulation=False)
-
-            # Group every n-th element of each channel into a list
-            csv_data = []
-            if len(sensor_data) > 1:
-                for i in range(0, len(sensor_data[0])):
-                    tmp_data = []
-                    for channel in range(0, len(sensor_data)):
-                        tmp_data.append(sensor_data[channel][i])
-                    csv_data.append(tmp_data)
-            elif len(sensor_data) == 1:
-                csv_data = sensor_data[0]
-
-            # Insert sensor data for this CSV timestamp
-            csv_row[sensor_idx] = csv_data
-            sensor_idx += 1
-
-        # Write current row into CSV file and increment CSV timestamp by one interval.
-        # If there is no data present in this row, exit while loop without writing to the file.
-        if csv_row != [[] for i in range(0, len(data.keys()))]:
             if normalize == True:
-                tmp_csv_timestamp = csv_timestamp - csv_timestamp_base
+                tmp_csv_timestamp = timestamp - csv_timestamp_base
             else:
-                tmp_csv_timestamp = csv_timestamp
+                tmp_csv_timestamp = timestamp
 
             # If start/stop timestamp parameters are specified, write to output file
             # when timestamps are between selected boundaries
             if (csv_start_timestamp == None) or (tmp_csv_timestamp >= csv_start_timestamp):
                 if (csv_stop_timestamp == None) or (csv_stop_timestamp > tmp_csv_timestamp):
-                    writer.writerow([tmp_csv_timestamp] +
-                                    csv_row + [args.label])
+                    lines.append(f"{tmp_csv_timestamp}," +
+                                 ",".join(f'"{cell}"' if "," in cell else cell for cell in csv_row) +
+                                 label_field)
                 else:
+                    done = True
                     break
-            csv_timestamp += interval
-        else:
-            break
+
+        csv_file.write("".join(lines))
+        row_idx += QEEXO_BLOCK_ROWS
 
     csv_file.close()
 
 
+# Convert values to integers of given data type, truncating like int() does
+def toInteger(values, d_type, name):
+    values = np.asarray(values)
+    if values.dtype.kind == 'f':
+        values = np.trunc(values)
+    info = np.iinfo(d_type)
+    if values.size > 0 and (values.min() < info.min or values.max() > info.max):
+        raise OverflowError(f"{name} out of range for {np.dtype(d_type).name}")
+
+    return values.astype(d_type)
+
+
+# Encode one sensor column of a Qeexo V2 CSV file into SDS records and write them
+# to an SDS file. Each cell is a JSON array with the samples of a 50 ms block that
+# starts at the row timestamp, sample timestamps are spread evenly over the block.
+def writeSensorSDS(filename, sensor, row_timestamps, cells):
+    # Parse the whole column at once
+    data = json.loads('[' + ','.join(cells) + ']')
+    n_samples = np.array([len(cell) for cell in data], dtype=np.int64)
+    rows = np.flatnonzero(n_samples > 0)
+    n_samples = n_samples[rows]
+    record_start = np.cumsum(n_samples) - n_samples
+
+    # Sample timestamps are accumulated one step at a time for all rows at once,
+    # which gives the same rounding as adding the step sample by sample
+    ts_step = QEEXO_ROW_DURATION / n_samples.astype(np.float64)
+    cur_ts = row_timestamps[rows].astype(np.float64)
+    timestamp = np.empty(int(n_samples.sum()))
+    for n in range(int(n_samples.max()) if len(rows) > 0 else 0):
+        active = np.flatnonzero(n_samples > n)
+        timestamp[record_start[active] + n] = cur_ts[active]
+        cur_ts[active] += ts_step[active]
+
+    # Build one SDS record (timestamp, data size, binary data) per sample
+    if sensor in QEEXO_SDS_SAMPLES:
+        d_type, n_values = QEEXO_SDS_SAMPLES[sensor]
+        samples = list(chain.from_iterable(data))
+        if any(n != n_values for n in set(map(len, samples))):
+            raise AssertionError(f"{sensor} samples must have {n_values} values")
+        samples = np.array(list(chain.from_iterable(samples))).reshape(-1, n_values)
+        record_type = np.dtype([('timestamp', '<u4'), ('size', '<u4'), ('data', d_type, (n_values,))])
+        records = np.empty(len(timestamp), dtype=record_type)
+        records['size'] = np.dtype(d_type).itemsize * n_values
+        records['data'] = toInteger(samples, d_type, f"{sensor} sample")
+    else:
+        records = np.empty(len(timestamp), dtype=[('timestamp', '<u4')])
+    records['timestamp'] = toInteger(timestamp, '<u4', f"{sensor} timestamp")
+
+    records.tofile(filename)
+
+
 # Write data from QeexoV2 CSV format into SDS files
+# Sensor columns are encoded in parallel worker processes
 def write_QeexoV2CSV_SDS(index):
+    row_timestamps = toInteger(csv_data['timestamp'].to_numpy(), np.int64, "timestamp")
+
     # Write each sensor's data to it's own SDS file named: <sensor>.<recording_id>.sds
-    for sensor in sensors:
-        filename = f'{sensor}.{index}.sds'
-        with open(filename, 'wb') as f:
-            for idx, row in csv_data.iterrows():
-                start_ts = int(row['timestamp'])
-                # Sensor data is a string which is a JSON array containing all of the samples
-                # at this 50ms timestamp block
-                all_samples = row[sensor]
-                data = json.loads(all_samples)
-                if len(data) > 0:
-                    # We have data to write out.
-                    ts_step = 50 / float(len(data))
-                    cur_ts = float(start_ts)
-
-                    # Write one record (timestamp, data size, binary data) of selected sensor to SDS file
-                    for sample in data:
-                        f.write(int(cur_ts).to_bytes(
-                            4, byteorder='little', signed=False))
-
-                        if (sensor == 'accel') or (sensor == 'gyro') or (sensor == 'magno'):
-                            # These are each 3-axes sensors (x,y,z) with int16 (2 byte) values
-                            assert (len(sample) == 3)
-                            data_size = int(3 * 2)
-                            sample_x = int(sample[0])
-                            sample_y = int(sample[1])
-                            sample_z = int(sample[2])
-                            f.write(data_size.to_bytes(
-                                4, byteorder='little', signed=False))
-                            f.write(sample_x.to_bytes(
-                                2, byteorder='little', signed=True))
-                            f.write(sample_y.to_bytes(
-                                2, byteorder='little', signed=True))
-                            f.write(sample_z.to_bytes(
-                                2, byteorder='little', signed=True))
-                        elif (sensor == 'temperature') or (sensor == 'humidity') or (sensor == 'microphone'):
-                            # These are single axes sensors with int16 (2 byte) values
-                            assert (len(sample) == 1)
-                            data_size = int(1 * 2)
-                            sample = int(sample[0])
-                            f.write(data_size.to_bytes(
-                                4, byteorder='little', signed=False))
-                            f.write(sample.to_bytes(
-                                2, byteorder='little', signed=True))
-                        elif (sensor == 'pressure'):
-                            # These are single axis sensors with int32 (4 byte) values
-                            assert (len(sample) == 1)
-                            data_size = int(1 * 4)
-                            sample = int(sample[0])
-                            f.write(data_size.to_bytes(
-                                4, byteorder='little', signed=True))
-                            f.write(sample.to_bytes(
-                                4, byteorder='little', signed=True))
-
-                        cur_ts += ts_step
+    tasks = [(f'{sensor}.{index}.sds', sensor, row_timestamps, csv_data[sensor].tolist())
+             for sensor in sorted(sensors)]
+    if len(tasks) > 1:
+        setWorkerExecutable()
+        with ProcessPoolExecutor(max_workers=min(len(tasks), os.cpu_count() or 1)) as executor:
+            futures = [executor.submit(writeSensorSDS, *task) for task in tasks]
+            for future in futures:
+                future.result()
+    else:
+        for task in tasks:
+            writeSensorSDS(*task)
 
 
 # Create and write WAV file with parameters from metadata file
-def write_SDS_AudioWAV(framerate, data, meta_data):
-    raw_data = data["raw_data"]
+# Record payloads are streamed as memoryviews straight from the SDS record index
+# into the output file, the data size in the header is patched at the end
+def write_SDS_AudioWAV(framerate, sds, meta_data, chunk_records=CHUNK_RECORDS):
     n_channels = len(meta_data)
-    d_type = getDataType(meta_data[0]["type"])
-    sample_width = calcsize(d_type)
+    sample_width = getDataType(meta_data[0]["type"]).itemsize
     print(n_channels, sample_width, framerate)
 
-    # Set audio parameters and write binary data to file
-    wave_file.setnchannels(n_channels)
-    wave_file.setsampwidth(sample_width)
-    wave_file.setframerate(framerate)
-    wave_file.writeframes(raw_data)
+    # Check audio parameters
+    framerate = int(round(framerate))
+    if not 1 <= sample_width <= 4:
+        sys.exit(f"Error in write_SDS_AudioWAV(): unsupported sample width {sample_width}")
+    if framerate <= 0:
+        sys.exit(f"Error in write_SDS_AudioWAV(): invalid frame rate {framerate}")
+
+    # Write header and binary data to file
+    wave_file.write(waveHeader(n_channels, sample_width, framerate, 0))
+    for start, stop in sds.chunks(chunk_records):
+        wave_file.writelines(sds.records(start, stop))
+
+    # Patch header with size of written data
+    data_size = wave_file.tell() - WAVE_HEADER_SIZE
+    wave_file.seek(0)
+    wave_file.write(waveHeader(n_channels, sample_width, framerate, data_size))
     wave_file.close()
 
 
+# Peak resident memory of this process in bytes, None if it cannot be determined
+def getPeakMemory():
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is reported in bytes on macOS and in kilobytes elsewhere
+        return peak if sys.platform == "darwin" else peak * 1024
+    except ImportError:
+        pass
+
+    if sys.platform == "win32":
+        import ctypes
+        from ctypes import wintypes
+
+        class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+            _fields_ = [("cb", wintypes.DWORD),
+                        ("PageFaultCount", wintypes.DWORD),
+                        ("PeakWorkingSetSize", ctypes.c_size_t),
+                        ("WorkingSetSize", ctypes.c_size_t),
+                        ("QuotaPeakPagedPoolUsage", ctypes.c_size_t),
+                        ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                        ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t),
+                        ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                        ("PagefileUsage", ctypes.c_size_t),
+                        ("PeakPagefileUsage", ctypes.c_size_t)]
+
+        counters = PROCESS_MEMORY_COUNTERS()
+        counters.cb = ctypes.sizeof(counters)
+        get_current_process = ctypes.windll.kernel32.GetCurrentProcess
+        get_current_process.restype = wintypes.HANDLE
+        get_memory_info = ctypes.windll.psapi.GetProcessMemoryInfo
+        get_memory_info.argtypes = [wintypes.HANDLE, ctypes.POINTER(PROCESS_MEMORY_COUNTERS), wintypes.DWORD]
+        if get_memory_info(get_current_process(), ctypes.byref(counters), counters.cb):
+            return counters.PeakWorkingSetSize
+
+    return None
+
+
+# Name of file written by export, EdgeImpulse export prefixes it with the class label
+def exportFileName(out_file, extension, ei_export, label):
+    if ei_export:
+        filename = Path(out_file).stem
+        dir_path = Path(out_file).parent
+        return dir_path / f"{label}.{filename}.{extension}"
+
+    return out_file
+
+
+# SHA-256 of file contents, read in blocks so memory use does not depend on file size
+def fileHash(filename):
+    sha256 = hashlib.sha256()
+    block = bytearray(HASH_BLOCK_SIZE)
+    view = memoryview(block)
+    with open(filename, "rb", buffering=0) as file:
+        while True:
+            n = file.readinto(block)
+            if not n:
+                break
+            sha256.update(view[:n])
+
+    return sha256.hexdigest()
+
+
+# Load conversion manifest of output directory, empty manifest if missing or invalid
+def loadManifest(out_dir):
+    try:
+        with open(os.path.join(out_dir, MANIFEST_NAME), "r", encoding="utf-8") as file:
+            manifest = json.load(file)
+        if manifest.get("version") == MANIFEST_VERSION and isinstance(manifest.get("outputs"), dict):
+            return manifest
+    except (OSError, ValueError, AttributeError):
+        pass
+
+    return {"version": MANIFEST_VERSION, "outputs": {}}
+
+
+# Write conversion manifest of output directory, replacing the old one atomically
+def saveManifest(out_dir, manifest):
+    filename = os.path.join(out_dir, MANIFEST_NAME)
+    try:
+        with open(f"{filename}.tmp", "w", encoding="utf-8") as file:
+            json.dump(manifest, file, indent=2, sort_keys=True)
+        os.replace(f"{filename}.tmp", filename)
+    except OSError as e:
+        print(f"Error writing conversion manifest: {e}")
+
+
+# Conversion options recorded in manifest
+def conversionParams(args, convert_format):
+    params = {"format": convert_format}
+    for name in MANIFEST_PARAMS:
+        params[name] = getattr(args, name, None)
+
+    return params
+
+
+# Name of output file in manifest: its path relative to the manifest directory,
+# or the file name if out_dir is not given
+def manifestName(out_file, out_dir=None):
+    if out_dir is None:
+        return os.path.basename(out_file)
+    return Path(os.path.relpath(out_file, out_dir)).as_posix()
+
+
+# Check if output file is up to date with its input files and conversion options.
+# Inputs are compared by size and mtime first, content is hashed only if the mtime
+# changed. Matching hashes refresh the stored mtime so the next check is fast again.
+def isUpToDate(manifest, out_file, in_files, params, out_dir=None):
+    entry = manifest["outputs"].get(manifestName(out_file, out_dir))
+    if entry is None or entry.get("params") != params:
+        return False
+
+    try:
+        stat = os.stat(out_file)
+        if [stat.st_size, stat.st_mtime_ns] != [entry["output"]["size"], entry["output"]["mtime_ns"]]:
+            return False
+
+        inputs = entry["inputs"]
+        if [item["path"] for item in inputs] != [os.path.abspath(filename) for filename in in_files]:
+            return False
+        for item in inputs:
+            stat = os.stat(item["path"])
+            if stat.st_size != item["size"]:
+                return False
+            if stat.st_mtime_ns != item["mtime_ns"]:
+                if fileHash(item["path"]) != item["sha256"]:
+                    return False
+                item["mtime_ns"] = stat.st_mtime_ns
+    except (OSError, KeyError, TypeError):
+        return False
+
+    return True
+
+
+# Manifest description of input files: path, size, mtime and content hash
+def inputInfo(in_files):
+    inputs = []
+    for filename in in_files:
+        stat = os.stat(filename)
+        inputs.append({"path": os.path.abspath(filename),
+                       "size": stat.st_size,
+                       "mtime_ns": stat.st_mtime_ns,
+                       "sha256": fileHash(filename)})
+
+    return inputs
+
+
+# Record output file with its inputs (see inputInfo()) and conversion options in manifest
+def updateManifest(manifest, out_file, inputs, params, out_dir=None):
+    name = manifestName(out_file, out_dir)
+    try:
+        stat = os.stat(out_file)
+    except OSError:
+        manifest["outputs"].pop(name, None)
+        return
+
+    manifest["outputs"][name] = {
+        "params": params,
+        "inputs": inputs,
+        "output": {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}}
+
+
+# Directory a glob pattern is relative to: its leading path without wildcards
+def globBase(pattern):
+    if not glob.has_magic(pattern):
+        return os.path.dirname(pattern)
+    base = []
+    for part in Path(pattern).parts:
+        if glob.has_magic(part):
+            break
+        base.append(part)
+    return os.path.join(*base) if base else ""
+
+
+# Collect SDS recordings from directories and glob patterns and pair each of them
+# with its YAML sensor description. Recordings are named <sensor>.<index>.sds, a
+# directory contributes the recordings of all sensors described by the YAML files,
+# including those in its subdirectories (e.g. sdsio_server namespaces). Each
+# recording is returned with its directory relative to the input directory, or
+# to the leading directory of the glob pattern.
+# A recording without matching sensor name uses the YAML file if only one is given,
+# unless a YAML file of its own sensor (<sensor>.sds.yml) is next to the recording.
+def batchRecordings(inputs, yaml_files):
+    sensors = {}
+    for filename in yaml_files:
+        try:
+            with open(filename, "r") as file:
+                yaml_data = yaml.load(file, Loader=yaml.FullLoader)["sds"]
+                sensors[yaml_data["name"]] = filename
+        except Exception as e:
+            sys.exit(f"Error loading YAML file: {e}")
+
+    recordings = {}     # recording -> directory relative to its input
+    for pattern in inputs:
+        if os.path.isdir(pattern):
+            base = pattern
+            found = []
+            for name in sensors:
+                found += glob.glob(os.path.join(glob.escape(pattern), "**", f"{glob.escape(name)}.*.sds"),
+                                   recursive=True)
+        else:
+            base = globBase(pattern)
+            found = glob.glob(pattern, recursive=True)
+        for recording in found:
+            recording = os.path.normpath(recording)
+            recordings.setdefault(recording, os.path.relpath(os.path.dirname(recording), base or "."))
+
+    pairs = []
+    fallback = []
+    for recording in sorted(recordings):
+        sensor = Path(recording).name.split('.')[0]
+        yaml_file = sensors.get(sensor)
+        if yaml_file is None and len(sensors) == 1 and \
+                not os.path.exists(os.path.join(os.path.dirname(recording), f"{sensor}.sds.yml")):
+            yaml_file = yaml_files[0]
+            fallback.append(recording)
+        pairs.append((recording, yaml_file, recordings[recording]))
+
+    if fallback:
+        print(f"Warning: {len(fallback)} recordings do not match sensor '{next(iter(sensors))}' "
+              f"of {yaml_files[0]}, converted with it anyway:")
+        for recording in fallback:
+            print(f"  {recording}")
+
+    return pairs
+
+
+# Convert one recording in a batch worker. Errors, including sys.exit() calls
+# of the converter, are returned as result instead of ending the whole batch.
+# Input files are described for the conversion manifest after a successful conversion.
+def convertFile(argv, in_files):
+    log = io.StringIO()
+    start_time = time.perf_counter()
+    inputs = None
+    try:
+        with contextlib.redirect_stdout(log), contextlib.redirect_stderr(log):
+            main(argv, use_cache=False)
+            inputs = inputInfo(in_files)
+        error = None
+    except SystemExit as e:
+        if e.code is None or e.code == 0:
+            error = None
+        elif isinstance(e.code, int):
+            error = f"exit status {e.code}"
+        else:
+            error = str(e.code)
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+
+    return error, log.getvalue(), time.perf_counter() - start_time, inputs
+
+
+# Convert all recordings selected by the batch arguments in parallel worker
+# processes. Output files are named <recording>.<extension>, in the directory of the
+# recording relative to its input (see batchRecordings()) under the output directory.
+def batchConvert(args):
+    extension = BATCH_FORMATS[args.format]
+    if args.format == "audio_wav" and (args.start_timestamp is not None or args.stop_timestamp is not None):
+        sys.exit(f"Start/stop timestamps are not supported by {args.format}")
+    if args.format in COLUMNAR_FORMATS and args.ei_export:
+        sys.exit(f"EdgeImpulse export is not supported by {args.format}")
+
+    recordings = batchRecordings(args.in_file, args.yaml)
+    if not recordings:
+        sys.exit(f"No SDS recordings found in: {args.in_file}")
+
+    try:
+        os.makedirs(args.out_dir, exist_ok=True)
+    except Exception as e:
+        sys.exit(f"Error creating output directory: {e}")
+
+    # Build converter arguments of each recording, recordings that cannot be
+    # converted are reported with their error right away
+    manifest = loadManifest(args.out_dir)
+    params = conversionParams(args, args.format)
+    tasks = []
+    outputs = {}
+    n_skipped = 0
+    for recording, yaml_file, rel_dir in recordings:
+        out_file = os.path.normpath(os.path.join(args.out_dir, rel_dir, f"{Path(recording).stem}.{extension}"))
+        if yaml_file is None:
+            tasks.append((recording, yaml_file, out_file, None, "No YAML sensor description for this recording"))
+            continue
+        if out_file in outputs:
+            tasks.append((recording, yaml_file, out_file, None, f"Output file is already written for {outputs[out_file]}"))
+            continue
+        outputs[out_file] = recording
+
+        # Skip recordings whose output is up to date, unless it is uploaded to Edge Impulse
+        export_file = exportFileName(out_file, extension, args.ei_export, args.label)
+        if not (args.force or args.ei_export) and \
+                isUpToDate(manifest, export_file, [recording, yaml_file], params, args.out_dir):
+            n_skipped += 1
+            continue
+        try:
+            os.makedirs(os.path.dirname(out_file), exist_ok=True)
+        except OSError as e:
+            tasks.append((recording, yaml_file, out_file, None, f"Error creating output directory: {e}"))
+            continue
+
+        argv = [args.format, '-i', recording, '-o', out_file, '-y', yaml_file,
+                '--chunk-records', str(args.chunk_records)]
+        if args.format not in COLUMNAR_FORMATS:
+            argv += ['--label', args.label]
+        if args.normalize:
+            argv.append('--normalize')
+        if args.ei_export:
+            argv.append('--ei-export')
+        if args.verbose:
+            argv.append('--verbose')
+        if args.start_timestamp is not None:
+            argv += ['--start-timestamp', repr(args.start_timestamp)]
+        if args.stop_timestamp is not None:
+            argv += ['--stop-timestamp', repr(args.stop_timestamp)]
+        tasks.append((recording, yaml_file, out_file, argv, None))
+
+    jobs = max(1, min(args.jobs, len(tasks)))
+    print(f"Converting {len(tasks)} recordings to {args.format} with {jobs} jobs, "
+          f"{n_skipped} up to date\n")
+
+    n_failed = 0
+    total_size = 0
+    start_time = time.perf_counter()
+    with contextlib.ExitStack() as stack:
+        # Single job runs in this process, so no worker needs to be started
+        if jobs > 1:
+            setWorkerExecutable()
+            executor = stack.enter_context(ProcessPoolExecutor(max_workers=jobs))
+            futures = [executor.submit(convertFile, argv, [recording, yaml_file]) if argv is not None else None
+                       for recording, yaml_file, _, argv, _ in tasks]
+        else:
+            futures = [None] * len(tasks)
+
+        for (recording, yaml_file, out_file, argv, error), future in zip(tasks, futures):
+            log = ""
+            seconds = 0
+            if argv is not None:
+                try:
+                    if future is not None:
+                        error, log, seconds, inputs = future.result()
+                    else:
+                        error, log, seconds, inputs = convertFile(argv, [recording, yaml_file])
+                except Exception as e:
+                    # Worker process failed, e.g. it was terminated
+                    error = f"{type(e).__name__}: {e}"
+
+            if args.verbose and log:
+                print(log.rstrip())
+            if error is None:
+                size = os.path.getsize(recording)
+                total_size += size
+                print(f"{recording} -> {out_file} ({size / (1024 * 1024):.1f} MB, {seconds:.2f} s)")
+                updateManifest(manifest, exportFileName(out_file, extension, args.ei_export, args.label),
+                               inputs, params, args.out_dir)
+            else:
+                n_failed += 1
+                print(f"Error converting {recording}: {error}")
+
+    saveManifest(args.out_dir, manifest)
+
+    # Aggregate throughput summary
+    elapsed = time.perf_counter() - start_time
+    total_mb = total_size / (1024 * 1024)
+    print(f"\nConverted {len(tasks) - n_failed} of {len(tasks)} recordings, {n_failed} failed, "
+          f"{n_skipped} up to date")
+    print(f"{total_mb:.1f} MB in {elapsed:.2f} s ({total_mb / elapsed if elapsed > 0 else 0:.1f} MB/s)")
+    if n_failed > 0:
+        sys.exit(1)
+
+
 def in_file(in_file):
     global in_extension
 
@@ -569,8 +1069,16 @@ def out_file(out_file):
     return out_file
 
 
+def positive_int(value):
+    value = int(value)
+    if value < 1:
+        raise argparse.ArgumentTypeError(f"Invalid value, must be at least 1: {value}")
+
+    return value
+
+
 # Main function
-def main(argv=None):
+def main(argv=None, use_cache=True):
     global in_extension, out_extension
 
     in_extension = []
@@ -602,6 +1110,13 @@ def main(argv=None):
                                             help="Class label for wav (EI needed) (default: %(default)s)", default='None')
     parser_audio_wav_optional.add_argument("--normalize", dest="normalize",
                                             help="Redundant, no used", action="store_true")
+    parser_audio_wav_optional.add_argument("--chunk-records", dest="chunk_records", metavar="<records>",
+                                           help="Number of SDS records decoded at once (default: %(default)s)",
+                                           type=positive_int, default=CHUNK_RECORDS)
+    parser_audio_wav_optional.add_argument("-v", "--verbose", dest="verbose",
+                                           help="Print peak memory usage", action="store_true")
+    parser_audio_wav_optional.add_argument("--force", dest="force",
+                                           help="Convert even if output is up to date", action="store_true")
 
     # Simple CSV
     parser_simple_csv = subparsers.add_parser(
@@ -628,6 +1143,13 @@ def main(argv=None):
     parser_simple_csv_optional.add_argument("--stop-timestamp", dest="stop_timestamp", metavar="<timestamp>",
                                             help="Stopping input data timestamp, in seconds (default: %(default)s)",
                                             type=float, default=None)
+    parser_simple_csv_optional.add_argument("--chunk-records", dest="chunk_records", metavar="<records>",
+                                            help="Number of SDS records decoded at once (default: %(default)s)",
+                                            type=positive_int, default=CHUNK_RECORDS)
+    parser_simple_csv_optional.add_argument("-v", "--verbose", dest="verbose",
+                                            help="Print peak memory usage", action="store_true")
+    parser_simple_csv_optional.add_argument("--force", dest="force",
+                                            help="Convert even if output is up to date", action="store_true")
 
     # Qeexo V2 CSV
     parser_qeexo_v2_csv = subparsers.add_parser(
@@ -658,9 +1180,88 @@ def main(argv=None):
     parser_qeexo_v2_csv_optional.add_argument("--sds_index", dest="sds_index", metavar="<sds_index>",
                                               help="SDS file index to write (default: <sensor>.%(default)s.sds)",
                                               type=int, default=0)
+    parser_qeexo_v2_csv_optional.add_argument("--chunk-records", dest="chunk_records", metavar="<records>",
+                                              help="Number of SDS records decoded at once (default: %(default)s)",
+                                              type=positive_int, default=CHUNK_RECORDS)
+    parser_qeexo_v2_csv_optional.add_argument("-v", "--verbose", dest="verbose",
+                                              help="Print peak memory usage", action="store_true")
+    parser_qeexo_v2_csv_optional.add_argument("--force", dest="force",
+                                              help="Convert even if output is up to date", action="store_true")
+
+    # Simple NPY / Parquet
+    for convert_format, extension in COLUMNAR_FORMATS.items():
+        parser_columnar = subparsers.add_parser(
+            convert_format, formatter_class=formatter)
+        parser_columnar_required = parser_columnar.add_argument_group(
+            "required")
+        parser_columnar_required.add_argument("-i", dest="in_file", metavar="<input_file>",
+                                              help="Input file", nargs="+", type=in_file, required=True)
+        parser_columnar_required.add_argument("-o", dest="out_file", metavar="<output_file>",
+                                              help=f"Output .{extension} file", type=out_file, required=True)
+        parser_columnar_optional = parser_columnar.add_argument_group(
+            "optional")
+        parser_columnar_optional.add_argument("-y", dest="yaml", metavar="<yaml_file>",
+                                              help="YAML sensor description file", nargs="+", default=None)
+        parser_columnar_optional.add_argument("--normalize", dest="normalize",
+                                              help="Normalize timestamps so they start with 0", action="store_true")
+        parser_columnar_optional.add_argument("--start-timestamp", dest="start_timestamp", metavar="<timestamp>",
+                                              help="Starting input data timestamp, in seconds (default: %(default)s)",
+                                              type=float, default=None)
+        parser_columnar_optional.add_argument("--stop-timestamp", dest="stop_timestamp", metavar="<timestamp>",
+                                              help="Stopping input data timestamp, in seconds (default: %(default)s)",
+                                              type=float, default=None)
+        parser_columnar_optional.add_argument("--chunk-records", dest="chunk_records", metavar="<records>",
+                                              help="Number of SDS records decoded at once (default: %(default)s)",
+                                              type=positive_int, default=CHUNK_RECORDS)
+        parser_columnar_optional.add_argument("-v", "--verbose", dest="verbose",
+                                              help="Print peak memory usage", action="store_true")
+        parser_columnar_optional.add_argument("--force", dest="force",
+                                              help="Convert even if output is up to date", action="store_true")
+
+    # Batch
+    parser_batch = subparsers.add_parser(
+        "batch", formatter_class=formatter)
+    parser_batch_required = parser_batch.add_argument_group("required")
+    parser_batch_required.add_argument("-f", dest="format", metavar="<format>",
+                                       help=f"Data conversion format: {', '.join(BATCH_FORMATS)}",
+                                       choices=BATCH_FORMATS, required=True)
+    parser_batch_required.add_argument("-i", dest="in_file", metavar="<input>",
+                                       help="Input directory (searched with subdirectories) or SDS file glob pattern",
+                                       nargs="+", required=True)
+    parser_batch_required.add_argument("-o", dest="out_dir", metavar="<output_dir>",
+                                       help="Output directory", required=True)
+    parser_batch_required.add_argument("-y", dest="yaml", metavar="<yaml_file>",
+                                       help="YAML sensor description file", nargs="+", required=True)
+    parser_batch_optional = parser_batch.add_argument_group("optional")
+    parser_batch_optional.add_argument("--jobs", dest="jobs", metavar="<jobs>",
+                                       help="Number of parallel worker processes (default: %(default)s)",
+                                       type=positive_int, default=os.cpu_count() or 1)
+    parser_batch_optional.add_argument("--normalize", dest="normalize",
+                                       help="Normalize timestamps so they start with 0", action="store_true")
+    parser_batch_optional.add_argument("--ei-export", dest="ei_export",
+                                       help="EdgeImpulse CSV/WAV ver.", action="store_true")
+    parser_batch_optional.add_argument("--label", dest="label", metavar="'label'",
+                                       help="Class label for sensor data (EI needed) (default: %(default)s)", default='None')
+    parser_batch_optional.add_argument("--start-timestamp", dest="start_timestamp", metavar="<timestamp>",
+                                       help="Starting input data timestamp, in seconds (default: %(default)s)",
+                                       type=float, default=None)
+    parser_batch_optional.add_argument("--stop-timestamp", dest="stop_timestamp", metavar="<timestamp>",
+                                       help="Stopping input data timestamp, in seconds (default: %(default)s)",
+                                       type=float, default=None)
+    parser_batch_optional.add_argument("--chunk-records", dest="chunk_records", metavar="<records>",
+                                       help="Number of SDS records decoded at once (default: %(default)s)",
+                                       type=positive_int, default=CHUNK_RECORDS)
+    parser_batch_optional.add_argument("-v", "--verbose", dest="verbose",
+                                       help="Print converter output of each recording", action="store_true")
+    parser_batch_optional.add_argument("--force", dest="force",
+                                       help="Convert even if output is up to date", action="store_true")
 
     args = parser.parse_args(argv)
 
+    if args.convert_format == "batch":
+        batchConvert(args)
+        return
+
     if not isinstance(args.in_file, list):
         args.in_file = [args.in_file]
     if not isinstance(args.out_file, list):
@@ -694,15 +1295,32 @@ def main(argv=None):
     else:
         sys.exit("SDS file is missing from arguments.")
 
-    # Load data from SDS file
+    # Skip conversion if output file is up to date with inputs and options. An
+    # Edge Impulse export is always run, the upload is not part of the output.
+    if 'sds' in in_extension:
+        out_name = exportFileName(other_files[0], "wav" if "wav" in args.convert_format else "csv",
+                                  getattr(args, "ei_export", False), getattr(args, "label", None))
+        if "wav" in args.convert_format:
+            out_name = str(out_name).split('.wav', maxsplit=1)[0] + '.wav'
+        out_dir = os.path.dirname(out_name)
+        cache_files = sds_files + args.yaml
+        cache_params = conversionParams(args, args.convert_format)
+        if use_cache:
+            manifest = loadManifest(out_dir)
+            if not (args.force or getattr(args, "ei_export", False)) and \
+                    isUpToDate(manifest, out_name, cache_files, cache_params):
+                print(f"{out_name} is up to date, skipping conversion")
+                # keep input mtimes refreshed by isUpToDate()
+                saveManifest(out_dir, manifest)
+                return
+
+    # Open SDS file and index its records
     if 'sds' in in_extension:
-        Record = RecordManager()
         data = {}
         i = 0
         for filename in sds_files:
             try:
-                with open(filename, "rb") as file:
-                    data[sensor_name[i]] = Record.getData(file)
+                data[sensor_name[i]] = SdsFile(filename)
             except Exception as e:
                 sys.exit(f"Error loading SDS file: {e}")
             i += 1
@@ -710,12 +1328,7 @@ def main(argv=None):
     # CSV
     if "csv" in args.convert_format:
         if 'sds' in in_extension:
-            if args.ei_export:
-                filename = Path(other_files[0]).stem
-                dir_path = Path(other_files[0]).parent
-                filename = dir_path / f"{args.label}.{filename}.csv"
-            else:
-                filename = other_files[0]
+            filename = exportFileName(other_files[0], "csv", getattr(args, "ei_export", False), args.label)
 
             createCSV(filename)
 
@@ -732,7 +1345,7 @@ def main(argv=None):
                 write_SDS_SimpleCSV(
                     args, data[sensor_name[0]], meta_data[sensor_name[0]], sensor_frequency[sensor_name[0]])
 
-            if args.ei_export:
+            if getattr(args, "ei_export", False):
                 print('Start uploading to Edge Impulse...\n')
                 try:
                     ingestion_edgeimpulse(filename)
@@ -751,12 +1364,7 @@ def main(argv=None):
     elif "wav" in args.convert_format:
         if 'sds' in in_extension:
 
-            if args.ei_export:
-                filename = Path(other_files[0]).stem
-                dir_path = Path(other_files[0]).parent
-                filename = dir_path / f"{args.label}.{filename}.wav"
-            else:
-                filename = other_files[0]
+            filename = exportFileName(other_files[0], "wav", getattr(args, "ei_export", False), args.label)
 
             createWAV(str(filename).split('.wav', maxsplit=1)[0])
 
@@ -766,9 +1374,10 @@ def main(argv=None):
                     sys.exit(
                         "Audio WAV file format only supports 1 metadata and 1 SDS file")
                 write_SDS_AudioWAV(
-                    sensor_frequency[sensor_name[0]], data[sensor_name[0]], meta_data[sensor_name[0]])
+                    sensor_frequency[sensor_name[0]], data[sensor_name[0]], meta_data[sensor_name[0]],
+                    args.chunk_records)
                 
-                if args.ei_export:
+                if getattr(args, "ei_export", False):
                    print('Start uploading to Edge Impulse...\n')
                    try:
                        ingestion_edgeimpulse(filename)
@@ -777,6 +1386,39 @@ def main(argv=None):
         else:
             sys.exit('WAV to SDS conversion is not supported.')
 
+    # NPY / Parquet
+    elif args.convert_format in COLUMNAR_FORMATS:
+        if 'sds' in in_extension:
+            # Only used for one sensor
+            if (len(args.yaml) > 1) or (len(sds_files) > 1):
+                sys.exit(
+                    "Simple NPY/Parquet file format only supports 1 metadata and 1 SDS file")
+            if args.convert_format == "simple_npy":
+                write_SDS_SimpleNPY(
+                    args, data[sensor_name[0]], meta_data[sensor_name[0]], sensor_frequency[sensor_name[0]],
+                    other_files[0])
+            else:
+                write_SDS_SimpleParquet(
+                    args, data[sensor_name[0]], meta_data[sensor_name[0]], sensor_frequency[sensor_name[0]],
+                    other_files[0])
+        else:
+            sys.exit(f'{args.convert_format} to SDS conversion is not supported.')
+
+    # Release SDS files and record conversion in manifest
+    if 'sds' in in_extension:
+        for sds in data.values():
+            sds.close()
+        if use_cache:
+            updateManifest(manifest, out_name, inputInfo(cache_files), cache_params)
+            saveManifest(out_dir, manifest)
+
+    if args.verbose:
+        peak_memory = getPeakMemory()
+        if peak_memory is not None:
+            print(f"Peak memory: {peak_memory / (1024 * 1024):.1f} MB")
+        else:
+            print("Peak memory: not available")
+
 
 # if __name__ == "__main__":
 # for Pystand
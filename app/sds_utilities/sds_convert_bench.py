@@ -0,0 +1,185 @@
+# Regression benchmark for the SDS converters.
+#
+# Writes synthetic accelerometer recordings (records of 8 samples x 3 float32
+# channels, 10 ms apart) with their YAML sensor description and times their
+# conversion. Conversion has to be linear in the recording size: with several
+# --sizes the throughput on the largest recording is compared to the one on
+# the smallest, and a drop below --min-ratio fails the benchmark.
+#
+# Recordings are kept in the work directory and only written again if their
+# size does not match, so repeated runs measure the conversion only.
+#
+# A batch check runs first: two subdirectories (like sdsio_server namespaces)
+# each holding Accelerometer.0.sds are converted from their parent directory
+# and from a glob pattern, both outputs have to be written in the same
+# subdirectories of the output directory.
+#
+#   python -m app.sds_utilities.sds_convert_bench --sizes 8 500 [--check-only]
+
+import argparse
+import os
+import os.path as path
+import shutil
+import time
+
+import numpy as np
+
+from .sds_convert import main as convert
+
+# Record layout of the synthetic recordings: timestamp, payload size, payload
+SAMPLES_PER_RECORD = 8
+CHANNELS = 3
+RECORD_INTERVAL = 10    # ms
+RECORD_DTYPE = np.dtype([("timestamp", "<u4"),
+                         ("size", "<u4"),
+                         ("payload", "<f4", (SAMPLES_PER_RECORD * CHANNELS,))])
+
+# Records generated at once while writing a recording
+WRITE_RECORDS = 256 * 1024
+
+YAML_DESCRIPTION = f"""sds:
+  name: Accelerometer
+  description: Synthetic accelerometer recording
+  frequency: {SAMPLES_PER_RECORD * 1000 // RECORD_INTERVAL}
+  content:
+  - value: x
+    type: float
+    scale: 1
+    unit: G
+  - value: y
+    type: float
+    scale: 1
+    unit: G
+  - value: z
+    type: float
+    scale: 1
+    unit: G
+"""
+
+# Output file extension and extra converter arguments of each format
+FORMATS = {"simple_csv": ("csv", []),
+           "qeexo_v2_csv": ("csv", ["--interval", "1000"]),
+           "simple_npy": ("npy", []),
+           "simple_parquet": ("parquet", [])}
+
+
+# Write a synthetic recording of size_mb MB, deterministic for a given seed
+def write_recording(fname, size_mb, seed=0):
+    n_records = int(size_mb * 1024 * 1024) // RECORD_DTYPE.itemsize
+    rng = np.random.default_rng(seed)
+    with open(fname, "wb") as f:
+        for start in range(0, n_records, WRITE_RECORDS):
+            records = np.empty(min(WRITE_RECORDS, n_records - start), dtype=RECORD_DTYPE)
+            records["timestamp"] = (np.arange(len(records), dtype=np.uint32) + start) * RECORD_INTERVAL
+            records["size"] = RECORD_DTYPE["payload"].itemsize
+            records["payload"] = rng.standard_normal(records["payload"].shape, dtype=np.float32)
+            records.tofile(f)
+    return n_records * RECORD_DTYPE.itemsize
+
+
+# Recording of size_mb MB in work_dir, written only if missing
+def prepare_recording(work_dir, size_mb):
+    fname = path.join(work_dir, f"Accelerometer.{size_mb:g}MB.sds")
+    size = int(size_mb * 1024 * 1024) // RECORD_DTYPE.itemsize * RECORD_DTYPE.itemsize
+    if not path.exists(fname) or path.getsize(fname) != size:
+        print(f"Writing {fname}")
+        write_recording(fname, size_mb)
+    return fname
+
+
+# Convert a recording, returns the conversion time in seconds
+def run_conversion(convert_format, recording, yaml_file, work_dir):
+    extension, extra_args = FORMATS[convert_format]
+    out_name = f"{path.basename(recording).rsplit('.', 1)[0]}.{convert_format}.{extension}"
+    start_time = time.perf_counter()
+    convert([convert_format, "-i", recording, "-o", path.join(work_dir, out_name), "-y", yaml_file,
+             "--force"] + extra_args)
+    return time.perf_counter() - start_time
+
+
+# Batch convert recordings with the same name in two subdirectories, from
+# their parent directory and from a glob pattern, returns the failures
+def check_batch_subdirectories(work_dir, yaml_file):
+    batch_dir = path.join(work_dir, "batch")
+    shutil.rmtree(batch_dir, ignore_errors=True)
+    subdirs = ["10.0.0.1", "10.0.0.2"]
+    for seed, subdir in enumerate(subdirs):
+        os.makedirs(path.join(batch_dir, "in", subdir))
+        write_recording(path.join(batch_dir, "in", subdir, "Accelerometer.0.sds"), 0.01, seed)
+
+    failed = []
+    inputs = {"directory": path.join(batch_dir, "in"),
+              "glob": path.join(batch_dir, "in", "*", "Accelerometer.*.sds")}
+    for name, batch_input in inputs.items():
+        out_dir = path.join(batch_dir, f"out_{name}")
+        try:
+            convert(["batch", "-f", "simple_csv", "-i", batch_input, "-o", out_dir, "-y", yaml_file])
+        except SystemExit as e:
+            if e.code:
+                failed.append(f"batch from {name}: exit {e.code}")
+                continue
+        outputs = [path.join(out_dir, subdir, "Accelerometer.0.csv") for subdir in subdirs]
+        missing = [out_file for out_file in outputs if not path.exists(out_file)]
+        if missing:
+            failed.append(f"batch from {name}: missing {', '.join(missing)}")
+        elif open(outputs[0], "rb").read() == open(outputs[1], "rb").read():
+            failed.append(f"batch from {name}: outputs of both recordings are the same")
+    return failed
+
+
+def parse_arguments(argv=None):
+    def formatter(prog): return argparse.HelpFormatter(
+        prog, max_help_position=41)
+    parser = argparse.ArgumentParser(
+        formatter_class=formatter, description="Regression benchmark for the SDS converters")
+    parser.add_argument("--sizes", dest="sizes", metavar="<MB>", nargs="+",
+                        help="Recording sizes in MB (default: 500)", type=float, default=[500])
+    parser.add_argument("--formats", dest="formats", metavar="<Format>", nargs="+",
+                        choices=list(FORMATS), help=f"Conversion formats: {', '.join(FORMATS)} "
+                        "(default: simple_csv)", default=["simple_csv"])
+    parser.add_argument("--workdir", dest="work_dir", metavar="<Dir>",
+                        help="Directory of recordings and outputs (default: sds_bench)", default="sds_bench")
+    parser.add_argument("--min-ratio", dest="min_ratio", metavar="<Ratio>",
+                        help="Lowest throughput on the largest recording relative to the smallest "
+                             "(default: 0.5)", type=float, default=0.5)
+    parser.add_argument("--check-only", dest="check_only", action="store_true",
+                        help="Run the batch check only, without benchmarks")
+    return parser.parse_args(argv)
+
+
+def start(argv=None):
+    args = parse_arguments(argv)
+    os.makedirs(args.work_dir, exist_ok=True)
+    yaml_file = path.join(args.work_dir, "Accelerometer.sds.yml")
+    with open(yaml_file, "w") as f:
+        f.write(YAML_DESCRIPTION)
+
+    failed = check_batch_subdirectories(args.work_dir, yaml_file)
+    for failure in failed:
+        print(f"FAILED {failure}")
+    print(f"Batch check: {'FAILED' if failed else 'ok'}")
+    if args.check_only:
+        return 1 if failed else 0
+
+    sizes = sorted(set(args.sizes))
+    recordings = [prepare_recording(args.work_dir, size_mb) for size_mb in sizes]
+
+    failed = len(failed)
+    for convert_format in args.formats:
+        rates = []
+        for recording in recordings:
+            seconds = run_conversion(convert_format, recording, yaml_file, args.work_dir)
+            size = path.getsize(recording)
+            rates.append(size / seconds / 2**20)
+            print(f"{convert_format}: {size / 2**20:.0f} MB in {seconds:.2f} s ({rates[-1]:.1f} MB/s)")
+        if len(rates) > 1:
+            ratio = rates[-1] / rates[0]
+            linear = ratio >= args.min_ratio
+            failed += not linear
+            print(f"{convert_format}: throughput ratio {ratio:.2f} "
+                  f"({'linear' if linear else 'NOT LINEAR'}, minimum {args.min_ratio})")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(start())
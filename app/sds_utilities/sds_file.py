@@ -0,0 +1,378 @@
+# SDS recording file reader
+#
+# An .sds recording is a sequence of records, each made of an 8-byte header
+# (uint32 timestamp, uint32 payload size, little endian) followed by the payload.
+# SdsFile memory-maps the recording, builds an index of all records in a single
+# pass and hands out payloads as memoryviews into the mapping, so no per-record
+# file reads or intermediate copies are needed.
+#
+# The record index is kept next to the recording in a sidecar file
+# (<recording>.sds.idx), so a recording is scanned only once. The sidecar holds
+# a header identifying the recording it was built for, followed by the index
+# entries. A sidecar that does not match the recording is rebuilt. Recordings
+# that are still being written are indexed in memory only, their sidecar would
+# be outdated with the next write.
+
+import mmap
+import multiprocessing
+import os
+import sys
+import time
+from pathlib import Path
+from struct import calcsize, pack, unpack_from
+
+import numpy as np
+
+HEADER_SIZE = 8
+
+# Number of file bytes scanned per block while building the record index
+INDEX_BLOCK_SIZE = 16 * 1024 * 1024
+
+# One entry per record: payload offset in file, timestamp and payload size
+INDEX_DTYPE = np.dtype([("offset", "<u8"),
+                        ("timestamp", "<u4"),
+                        ("size", "<u4")])
+
+# Sidecar index file: extension appended to the recording file name, and header
+# holding magic, recording file size, modification time and number of records
+INDEX_FILE_EXTENSION = ".idx"
+INDEX_FILE_MAGIC = b"SDSIDX01"
+INDEX_FILE_HEADER = "<8sQQQ"
+INDEX_FILE_HEADER_SIZE = calcsize(INDEX_FILE_HEADER)
+
+# A recording modified within this many seconds is considered still recording
+INDEX_FILE_SETTLE_TIME = 5.0
+
+# C style data types used in YAML sensor description files
+DATA_TYPES = {"int16_t": "<i2",
+              "uint16_t": "<u2",
+              "int32_t": "<i4",
+              "uint32_t": "<u4",
+              "float": "<f4",
+              "double": "<f8"}
+
+
+# Convert C style data type to NumPy data type
+def getDataType(data_type):
+    if data_type in DATA_TYPES:
+        d_type = DATA_TYPES[data_type]
+    else:
+        print(f"Unknown data type: {data_type}\n")
+        d_type = DATA_TYPES["uint32_t"]
+
+    return np.dtype(d_type)
+
+
+# Convert YAML content description into a structured data type describing
+# one sample, with one field per interleaved channel
+def getContentDtype(content):
+    return np.dtype([(f"ch{n}", getDataType(channel["type"]))
+                     for n, channel in enumerate(content)])
+
+
+# Decode raw payload data according to YAML content description and return
+# a list of NumPy arrays, one per channel. Trailing bytes that do not form a
+# complete sample are ignored.
+def decodeData(raw_data, content, data_manipulation=True):
+    d_type = getContentDtype(content)
+    n_samples = len(raw_data) // d_type.itemsize
+    samples = np.frombuffer(raw_data, dtype=d_type, count=n_samples)
+
+    channel_data = []
+    for n, channel in enumerate(content):
+        data = samples[f"ch{n}"]
+        # Scale and offset data points
+        if data_manipulation:
+            scale = channel.get("scale", 1)
+            offset = channel.get("offset", 0)
+            # Keep Python semantics: integer data stays integer only when
+            # both scale and offset are integers, otherwise it becomes float
+            if data.dtype.kind == "f" or isinstance(scale, float) or isinstance(offset, float):
+                data = data.astype(np.float64)
+            else:
+                data = data.astype(np.int64)
+            if scale != 1:
+                data *= scale
+            if offset != 0:
+                data += offset
+        channel_data.append(data)
+
+    return channel_data
+
+
+class SdsFile:
+    # save_index: write the sidecar index if it had to be built. None saves it
+    # once the recording is complete, True always (e.g. by the recorder right
+    # after closing the recording), False never.
+    def __init__(self, file_name, save_index=None):
+        self.file_name = file_name
+        self.is_sorted = None
+        self.file = open(file_name, "rb")
+        try:
+            self.file_size = os.fstat(self.file.fileno()).st_size
+            # Zero-length files cannot be mapped
+            if self.file_size > 0:
+                self.mm = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                self.mm = None
+            self.view = memoryview(self.mm if self.mm is not None else b"")
+            self.index = self.__loadIndexFile()
+            if self.index is None:
+                self.index = self.__buildIndex()
+                if save_index or (save_index is None and not self.__isGrowing()):
+                    self.__saveIndexFile()
+        except Exception:
+            self.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        return len(self.index)
+
+    # Release the mapping and close the underlying file
+    def close(self):
+        if getattr(self, "view", None) is not None:
+            self.view.release()
+            self.view = None
+        if getattr(self, "mm", None) is not None:
+            try:
+                self.mm.close()
+            except BufferError:
+                # Payload views are still referenced, mapping is released with them
+                pass
+            self.mm = None
+        if getattr(self, "file", None) is not None:
+            self.file.close()
+            self.file = None
+
+    # Record timestamps (uint32 array)
+    @property
+    def timestamp(self):
+        return self.index["timestamp"]
+
+    # Record payload sizes (uint32 array)
+    @property
+    def data_size(self):
+        return self.index["size"]
+
+    # Range [start, stop) of records that cover the time window
+    # [start_timestamp, stop_timestamp] given in ms. The record before the
+    # window is included, as its samples may extend into the window.
+    # Records without ascending timestamps cannot be searched and are
+    # returned as a whole.
+    def findRecords(self, start_timestamp=None, stop_timestamp=None):
+        timestamp = self.index["timestamp"]
+        start = 0
+        stop = len(timestamp)
+        if self.is_sorted is None:
+            self.is_sorted = bool(np.all(timestamp[1:] >= timestamp[:-1]))
+        if not self.is_sorted:
+            return start, stop
+        if start_timestamp is not None:
+            start = max(int(np.searchsorted(timestamp, start_timestamp, side="left")) - 1, 0)
+        if stop_timestamp is not None:
+            stop = int(np.searchsorted(timestamp, stop_timestamp, side="right"))
+        return start, max(start, stop)
+
+    # Header identifying the recording file a sidecar index belongs to
+    def __indexFileHeader(self, n_records):
+        st = os.fstat(self.file.fileno())
+        return pack(INDEX_FILE_HEADER, INDEX_FILE_MAGIC, st.st_size, st.st_mtime_ns, n_records)
+
+    # Check if the recording is still being written: it grew since it was
+    # mapped or was modified within INDEX_FILE_SETTLE_TIME seconds
+    def __isGrowing(self):
+        st = os.fstat(self.file.fileno())
+        return st.st_size != self.file_size or time.time() - st.st_mtime < INDEX_FILE_SETTLE_TIME
+
+    # Load record index from the sidecar file.
+    # Returns None if there is no sidecar or it does not match the recording.
+    def __loadIndexFile(self):
+        try:
+            with open(self.file_name + INDEX_FILE_EXTENSION, "rb") as f:
+                header = f.read(INDEX_FILE_HEADER_SIZE)
+                if len(header) != INDEX_FILE_HEADER_SIZE:
+                    return None
+                n_records = unpack_from(INDEX_FILE_HEADER, header)[3]
+                if header != self.__indexFileHeader(n_records):
+                    return None
+                index = np.fromfile(f, dtype=INDEX_DTYPE, count=n_records)
+        except (OSError, ValueError):
+            return None
+        if len(index) != n_records:
+            return None
+
+        # Spot check last record against its header in the recording
+        if n_records > 0:
+            offset, timestamp, size = index[-1].tolist()
+            if offset < HEADER_SIZE or offset + size > self.file_size:
+                return None
+            if unpack_from("<I", self.mm, offset - HEADER_SIZE)[0] != timestamp:
+                return None
+        return index
+
+    # Save record index to the sidecar file. The recording directory may not be
+    # writable, in which case the index is only kept in memory.
+    def __saveIndexFile(self):
+        index_file = self.file_name + INDEX_FILE_EXTENSION
+        tmp_file = index_file + ".tmp"
+        try:
+            with open(tmp_file, "wb") as f:
+                f.write(self.__indexFileHeader(len(self.index)))
+                self.index.tofile(f)
+            os.replace(tmp_file, index_file)
+        except OSError:
+            try:
+                os.remove(tmp_file)
+            except OSError:
+                pass
+
+    # Build record index with one pass over the mapped file.
+    # The file is scanned in blocks of INDEX_BLOCK_SIZE bytes, scanned pages are
+    # released after each block so indexing does not keep the whole file resident.
+    def __buildIndex(self):
+        index = self.__buildFixedSizeIndex()
+        if index is not None:
+            return index
+
+        blocks = []
+        pos = 0
+        block_start = 0
+        while pos + HEADER_SIZE <= self.file_size:
+            offsets = []
+            timestamps = []
+            sizes = []
+            block_end = min(block_start + INDEX_BLOCK_SIZE, self.file_size)
+            while pos + HEADER_SIZE <= block_end:
+                timestamp, size = unpack_from("<II", self.mm, pos)
+                pos += HEADER_SIZE
+                # Truncated last record keeps only the bytes that are present
+                size = min(size, self.file_size - pos)
+                offsets.append(pos)
+                timestamps.append(timestamp)
+                sizes.append(size)
+                pos += size
+
+            block = np.empty(len(offsets), dtype=INDEX_DTYPE)
+            block["offset"] = offsets
+            block["timestamp"] = timestamps
+            block["size"] = sizes
+            blocks.append(block)
+            self.__releaseBytes(block_start, min(pos, self.file_size))
+            block_start = max(pos, block_end)
+
+        if len(blocks) == 1:
+            return blocks[0]
+        return np.concatenate(blocks) if blocks else np.empty(0, dtype=INDEX_DTYPE)
+
+    # Fast path for recordings where every record has the same payload size,
+    # which is the common case for sensor streams. Headers are read through a
+    # strided view instead of a Python loop. Returns None if not applicable.
+    def __buildFixedSizeIndex(self):
+        if self.file_size < HEADER_SIZE:
+            return None
+        size = unpack_from("<I", self.mm, 4)[0]
+        record_size = HEADER_SIZE + size
+        if self.file_size % record_size != 0:
+            return None
+
+        n_records = self.file_size // record_size
+        index = np.empty(n_records, dtype=INDEX_DTYPE)
+        block_records = max(1, INDEX_BLOCK_SIZE // record_size)
+        for start in range(0, n_records, block_records):
+            stop = min(start + block_records, n_records)
+            headers = np.ndarray((stop - start, 2), dtype="<u4", buffer=self.mm,
+                                 offset=start * record_size, strides=(record_size, 4))
+            try:
+                if not np.all(headers[:, 1] == size):
+                    return None
+                index["timestamp"][start:stop] = headers[:, 0]
+            finally:
+                # Drop the exported buffer so the mapping can be closed later
+                del headers
+            index["offset"][start:stop] = np.arange(start, stop, dtype=np.uint64) * record_size + HEADER_SIZE
+            self.__releaseBytes(start * record_size, stop * record_size)
+
+        index["size"] = size
+        return index
+
+    # Return payload of record n as a zero-copy memoryview
+    def getRecord(self, n):
+        offset = int(self.index["offset"][n])
+        return self.view[offset:offset + int(self.index["size"][n])]
+
+    # Iterate over payloads of records [start, stop) as zero-copy memoryviews.
+    # If frame_size is given, trailing bytes of each record that do not form
+    # a complete frame (sample of all channels) are left out.
+    def records(self, start=0, stop=None, frame_size=None):
+        for offset, size in self.index[["offset", "size"]][start:stop].tolist():
+            if frame_size:
+                size -= size % frame_size
+            yield self.view[offset:offset + size]
+
+    # Return concatenated payloads of records [start, stop).
+    # Equally sized records at a fixed distance, which is the common case, are
+    # gathered with a single strided copy instead of one slice per record.
+    def readData(self, start=0, stop=None, frame_size=None):
+        index = self.index[start:stop]
+        if len(index) > 1:
+            size = int(index["size"][0])
+            if frame_size:
+                size -= size % frame_size
+            stride = int(index["offset"][1]) - int(index["offset"][0])
+            if (np.all(index["size"] == index["size"][0]) and
+                    np.all(np.diff(index["offset"].astype(np.int64)) == stride)):
+                payloads = np.ndarray((len(index), size), dtype=np.uint8, buffer=self.mm,
+                                      offset=int(index["offset"][0]), strides=(stride, 1))
+                try:
+                    return payloads.tobytes()
+                finally:
+                    # Drop the exported buffer so the mapping can be closed later
+                    del payloads
+
+        return b"".join(self.records(start, stop, frame_size))
+
+    # Iterate over record ranges [start, stop) of at most chunk_records records.
+    # Mapped pages of a finished range are released where the platform supports
+    # it, so resident memory does not grow with the length of the recording.
+    def chunks(self, chunk_records, start=0, stop=None):
+        stop = len(self) if stop is None else min(stop, len(self))
+        for chunk_start in range(start, stop, chunk_records):
+            chunk_stop = min(chunk_start + chunk_records, stop)
+            yield chunk_start, chunk_stop
+            self.__releaseBytes(int(self.index["offset"][chunk_start]) - HEADER_SIZE,
+                                int(self.index["offset"][chunk_stop - 1]) +
+                                int(self.index["size"][chunk_stop - 1]))
+
+    # Drop mapped pages of file bytes [begin, end) from the process working set.
+    # Pages are read again from the file if they are accessed later.
+    def __releaseBytes(self, begin, end):
+        if self.mm is None or not hasattr(mmap, "MADV_DONTNEED"):
+            return
+        begin -= begin % mmap.PAGESIZE
+        if end > begin:
+            self.mm.madvise(mmap.MADV_DONTNEED, begin, end - begin)
+
+
+# Decode a recording in chunks of at most chunk_records records.
+# Yields (start, stop, channel_data) for each record range [start, stop).
+def decodeChunks(sds, content, chunk_records, data_manipulation=True, start=0, stop=None):
+    frame_size = getContentDtype(content).itemsize
+    for chunk_start, chunk_stop in sds.chunks(chunk_records, start, stop):
+        raw_data = sds.readData(chunk_start, chunk_stop, frame_size)
+        yield chunk_start, chunk_stop, decodeData(raw_data, content, data_manipulation)
+
+
+# Packaged builds are started through a launcher executable, worker processes
+# have to be started with the Python interpreter of the bundled runtime instead
+def setWorkerExecutable():
+    if Path(sys.executable).stem.lower().startswith("python"):
+        return
+    python = Path(sys.executable).parent / "runtime" / "python.exe"
+    if python.exists():
+        multiprocessing.set_executable(str(python))
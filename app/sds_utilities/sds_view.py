@@ -17,63 +17,35 @@
 # SDS-View
 
 import argparse
-import struct
+import contextlib
+import json
 import sys
 import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from struct import calcsize, pack, unpack_from
 
-import matplotlib.pyplot as plt
+import matplotlib
+from matplotlib.figure import Figure
 import numpy as np
 import yaml
 
+from .sds_file import SdsFile, getContentDtype, decodeChunks, setWorkerExecutable
 
-class RecordManager:
-    def __init__(self):
-        self.HEADER_SIZE = 8
-        self.TIMESTAMP_SIZE = 4
-        self.data = bytearray()
-
-    # Flush data buffer
-    def flush(self):
-        self.data = bytearray()
-
-    # Private function for retrieving data from record
-    def __getRecord(self, file):
-        record = bytearray(file.read(self.HEADER_SIZE))
-        if len(record) == self.HEADER_SIZE:
-            timestamp = struct.unpack("I", record[:self.TIMESTAMP_SIZE])[0]
-            data_size = struct.unpack("I", record[self.TIMESTAMP_SIZE:])[0]
-            self.data.extend(bytearray(file.read(data_size)))
-            return True
-        else:
-            return False
-
-    # Extract all data from recording file
-    def getData(self, file):
-        record = True
-        while record:
-            record = self.__getRecord(file)
-        return self.data
-
-
-# Convert C style data type to Python style
-def getDataType(data_type):
-    if data_type == "int16_t":
-        d_type = "h"
-    elif data_type == "uint16_t":
-        d_type = "H"
-    elif data_type == "int32_t":
-        d_type = "i"
-    elif data_type == "uint32_t":
-        d_type = "I"
-    elif data_type == "float":
-        d_type = "f"
-    elif data_type == "double":
-        d_type = "d"
-    else:
-        print(f"Unknown data type: {data_type}\n")
-        d_type = "I"
+# Number of SDS records decoded at once
+VIEW_CHUNK_RECORDS = 4096
+
+# Overview pyramid cached next to the recording (<recording>.sds.ovw).
+# Level 0 holds min/max/mean of each channel per OVERVIEW_BUCKET_SIZE samples,
+# each further level combines OVERVIEW_LEVEL_FACTOR buckets of the level below.
+OVERVIEW_FILE_EXTENSION = ".ovw"
+OVERVIEW_MAGIC = b"SDSOVW01"
+OVERVIEW_HEADER = "<8sI"
+OVERVIEW_HEADER_SIZE = calcsize(OVERVIEW_HEADER)
+OVERVIEW_VERSION = 1
+OVERVIEW_BUCKET_SIZE = 256
+OVERVIEW_LEVEL_FACTOR = 4
 
-    return d_type
 
 # Open SDS data file in read mode
 
@@ -99,80 +71,315 @@ def closeFile(file_name):
         print(f"Error in closeFile({file_name}): {e}")
         sys.exit(1)
 
-# Create new figure and plot content
-
-
-def plotData(all_data, data_desc, freq, title, view3D):
+# Sample indices of the minimum and maximum of each bucket of bucket_size
+# samples, in time order. A trailing partial bucket is reduced as well.
+def minMaxEnvelope(data, bucket_size):
+    n_buckets = -(-len(data) // bucket_size)
+    padded = np.resize(data, n_buckets * bucket_size).reshape(n_buckets, bucket_size)
+    # Padding repeats data from the start, so it is masked in the last bucket
+    n_last = len(data) - (n_buckets - 1) * bucket_size
+    i_min = padded.argmin(axis=1)
+    i_max = padded.argmax(axis=1)
+    i_min[-1] = padded[-1, :n_last].argmin()
+    i_max[-1] = padded[-1, :n_last].argmax()
+
+    base = np.arange(n_buckets) * bucket_size
+    sample_idx = np.empty(2 * n_buckets, dtype=np.int64)
+    sample_idx[0::2] = base + np.minimum(i_min, i_max)
+    sample_idx[1::2] = base + np.maximum(i_min, i_max)
+    return sample_idx
+
+
+# Decode records [start, stop) in chunks and reduce each channel to a min/max
+# envelope of at most n_buckets buckets, so the number of plotted points does
+# not depend on the length of the recording. Short windows are returned at
+# full resolution. Returns sample indices and values of each channel, and an
+# evenly strided selection of all channels for the 3D view.
+def readEnvelope(sds, data_desc, start, stop, n_buckets):
+    frame_size = getContentDtype(data_desc).itemsize
+    n_samples = int((sds.data_size[start:stop] // frame_size).sum(dtype=np.int64))
+    bucket_size = max(1, -(-n_samples // n_buckets))
+
+    n_channels = len(data_desc)
+    sample_idx = [[] for _ in range(n_channels)]
+    values = [[] for _ in range(n_channels)]
+    strided = [[] for _ in range(n_channels)]
+    carry = [None] * n_channels
+    offset = 0
+    for chunk_start, chunk_stop, channel_data in decodeChunks(sds, data_desc, VIEW_CHUNK_RECORDS, start=start, stop=stop):
+        last = (chunk_stop == stop)
+        for n, data in enumerate(channel_data):
+            if carry[n] is not None:
+                data = np.concatenate((carry[n], data))
+            # Only complete buckets are reduced, the rest is kept for the next chunk
+            n_full = len(data) if last else len(data) // bucket_size * bucket_size
+            carry[n] = data[n_full:]
+            data = data[:n_full]
+            if len(data) == 0:
+                continue
+            if bucket_size > 1:
+                idx = minMaxEnvelope(data, bucket_size)
+                sample_idx[n].append(offset + idx)
+                values[n].append(data[idx])
+            else:
+                sample_idx[n].append(offset + np.arange(len(data)))
+                values[n].append(data)
+            # Copy, so the decoded chunk is not kept alive by the view
+            strided[n].append(data[::bucket_size].copy())
+        offset += n_full
+
+    def join(parts):
+        return [np.concatenate(part) if part else np.empty(0) for part in parts]
+    return join(sample_idx), join(values), join(strided), bucket_size
+
+
+# Identification of the recording and channel description an overview is built
+# for. A cached overview with a different key is out of date.
+def overviewKey(sds, data_desc):
+    st = os.fstat(sds.file.fileno())
+    content = [{"type": desc["type"], "scale": desc.get("scale", 1), "offset": desc.get("offset", 0)}
+               for desc in data_desc]
+    return json.loads(json.dumps({"version": OVERVIEW_VERSION, "size": st.st_size,
+                                  "mtime_ns": st.st_mtime_ns, "content": content}))
+
+
+# Build overview pyramid of a recording in one streaming pass over its records.
+# Returns the number of samples and a list of levels, each an array of shape
+# (buckets, channels, 3) holding min, max and mean of every bucket.
+def buildOverview(sds, data_desc):
+    n_channels = len(data_desc)
+    bucket_size = OVERVIEW_BUCKET_SIZE
+    stats = [[] for _ in range(n_channels)]
+    carry = [None] * n_channels
+    n_samples = 0
+    for chunk_start, chunk_stop, channel_data in decodeChunks(sds, data_desc, VIEW_CHUNK_RECORDS):
+        last = (chunk_stop == len(sds))
+        for n, data in enumerate(channel_data):
+            if carry[n] is not None:
+                data = np.concatenate((carry[n], data))
+            # Only complete buckets are reduced, the rest is kept for the next chunk
+            n_full = len(data) if last else len(data) // bucket_size * bucket_size
+            carry[n] = data[n_full:].copy()
+            data = data[:n_full]
+            if len(data) == 0:
+                continue
+            starts = np.arange(0, len(data), bucket_size)
+            stats[n].append((np.minimum.reduceat(data, starts),
+                             np.maximum.reduceat(data, starts),
+                             np.add.reduceat(data.astype(np.float64), starts)))
+        n_samples += n_full
+
+    n_buckets = -(-n_samples // bucket_size)
+    level = np.empty((n_buckets, n_channels, 3))
+    for n, parts in enumerate(stats):
+        for i, part in enumerate(zip(*parts)):
+            level[:, n, i] = np.concatenate(part)
+    counts = np.full(n_buckets, bucket_size, dtype=np.float64)
+    if n_buckets > 0:
+        counts[-1] = n_samples - (n_buckets - 1) * bucket_size
+
+    # Sums are turned into means once the levels above are built from them
+    levels = [level]
+    level_counts = [counts]
+    while len(level) > OVERVIEW_LEVEL_FACTOR:
+        starts = np.arange(0, len(level), OVERVIEW_LEVEL_FACTOR)
+        level = np.stack((np.minimum.reduceat(level[:, :, 0], starts),
+                          np.maximum.reduceat(level[:, :, 1], starts),
+                          np.add.reduceat(level[:, :, 2], starts)), axis=2)
+        counts = np.add.reduceat(counts, starts)
+        levels.append(level)
+        level_counts.append(counts)
+    for level, counts in zip(levels, level_counts):
+        level[:, :, 2] /= counts[:, None]
+
+    return n_samples, levels
+
+
+# Save overview pyramid next to the recording. The header is followed by the
+# levels, stored as float64 arrays so each of them can be memory mapped alone.
+# The recording directory may not be writable, then the overview is not cached.
+def saveOverview(file_name, key, n_samples, levels):
+    header = {"key": key, "n_samples": n_samples, "levels": []}
+    offset = 0
+    for n, level in enumerate(levels):
+        header["levels"].append({"bucket_size": OVERVIEW_BUCKET_SIZE * OVERVIEW_LEVEL_FACTOR ** n,
+                                 "n_buckets": len(level), "offset": offset})
+        offset += level.nbytes
+    header = json.dumps(header).encode("utf-8")
+    header += b" " * (-(OVERVIEW_HEADER_SIZE + len(header)) % 8)
+
+    overview_file = file_name + OVERVIEW_FILE_EXTENSION
+    tmp_file = overview_file + ".tmp"
+    try:
+        with open(tmp_file, "wb") as f:
+            f.write(pack(OVERVIEW_HEADER, OVERVIEW_MAGIC, len(header)))
+            f.write(header)
+            for level in levels:
+                level.tofile(f)
+        os.replace(tmp_file, overview_file)
+    except OSError:
+        try:
+            os.remove(tmp_file)
+        except OSError:
+            pass
+
+
+# Load header of cached overview. Returns None if there is no overview for
+# this recording and channel description.
+def loadOverviewHeader(file_name, key):
+    try:
+        with open(file_name + OVERVIEW_FILE_EXTENSION, "rb") as f:
+            data = f.read(OVERVIEW_HEADER_SIZE)
+            if len(data) != OVERVIEW_HEADER_SIZE:
+                return None
+            magic, header_size = unpack_from(OVERVIEW_HEADER, data)
+            if magic != OVERVIEW_MAGIC:
+                return None
+            header = json.loads(f.read(header_size))
+    except (OSError, ValueError):
+        return None
+    if not isinstance(header, dict) or header.get("key") != key:
+        return None
+
+    header["data_offset"] = OVERVIEW_HEADER_SIZE + header_size
+    return header
+
+
+# Read buckets [begin, end) of one level of a cached overview. Only the pages
+# of these buckets are read from the file.
+def loadOverviewLevel(file_name, header, n, n_channels, begin, end):
+    level = header["levels"][n]
+    data = np.memmap(file_name + OVERVIEW_FILE_EXTENSION, dtype="<f8", mode="r",
+                     offset=header["data_offset"] + level["offset"],
+                     shape=(level["n_buckets"], n_channels, 3))
+    try:
+        return np.array(data[begin:end])
+    finally:
+        # Close the mapping, so the overview can be replaced later
+        del data
+
+
+# Read min/max envelope of records [start, stop) from the overview pyramid, using
+# the coarsest level with at least n_buckets buckets in the window. The overview
+# is built and cached on first use. Returns None if the window is short enough to
+# be decoded directly, see readEnvelope() for the returned values.
+def readOverview(sds, data_desc, start, stop, n_buckets):
+    frame_size = getContentDtype(data_desc).itemsize
+    n_samples = sds.data_size // frame_size
+    first = int(n_samples[:start].sum(dtype=np.int64))
+    last = first + int(n_samples[start:stop].sum(dtype=np.int64))
+    if last - first < OVERVIEW_BUCKET_SIZE * n_buckets:
+        return None
+
+    key = overviewKey(sds, data_desc)
+    header = loadOverviewHeader(sds.file_name, key)
+    levels = None
+    if header is None:
+        total, levels = buildOverview(sds, data_desc)
+        saveOverview(sds.file_name, key, total, levels)
+        header = {"levels": [{"bucket_size": OVERVIEW_BUCKET_SIZE * OVERVIEW_LEVEL_FACTOR ** n,
+                              "n_buckets": len(level)} for n, level in enumerate(levels)]}
+
+    n = max(n for n, level in enumerate(header["levels"])
+            if (last - first) // level["bucket_size"] >= n_buckets)
+    bucket_size = header["levels"][n]["bucket_size"]
+    begin = first // bucket_size
+    end = -(-last // bucket_size)
+    if levels is not None:
+        buckets = levels[n][begin:end]
+    else:
+        buckets = loadOverviewLevel(sds.file_name, header, n, len(data_desc), begin, end)
+
+    # Minimum and maximum of each bucket are plotted at the bucket center
+    center = (np.arange(begin, end) * bucket_size + bucket_size / 2) - first
+    sample_idx = np.repeat(center, 2)
+    values = []
+    means = []
+    for ch in range(len(data_desc)):
+        envelope = np.empty(2 * len(buckets))
+        envelope[0::2] = buckets[:, ch, 0]
+        envelope[1::2] = buckets[:, ch, 1]
+        values.append(envelope)
+        means.append(buckets[:, ch, 2])
+    return [sample_idx] * len(data_desc), values, means, bucket_size
+
+
+# Read plot data of one recording: envelope of the records covering the time
+# window [start_time, stop_time], in seconds relative to the first record.
+# Runs in a worker process when several recordings are plotted, so only the
+# compact envelope is passed back. Returns (t_start, envelope), see readEnvelope().
+def loadPlotData(file_name, data_desc, start_time, stop_time, n_buckets):
+    with SdsFile(file_name) as sds:
+        # Read only the records covering the requested time window
+        start, stop = 0, len(sds)
+        t_start = 0
+        if len(sds) > 0 and (start_time is not None or stop_time is not None):
+            timestamp_base = int(sds.timestamp[0])
+            start, stop = sds.findRecords(
+                None if start_time is None else timestamp_base + start_time * 1000,
+                None if stop_time is None else timestamp_base + stop_time * 1000)
+            if start < stop:
+                t_start = (int(sds.timestamp[start]) - timestamp_base) / 1000
+
+        # Long windows are read from the cached overview pyramid
+        envelope = readOverview(sds, data_desc, start, stop, n_buckets)
+        if envelope is None:
+            envelope = readEnvelope(sds, data_desc, start, stop, n_buckets)
+
+    return t_start, envelope
+
+
+# Create new figure, plot content and save it to out_file.
+# The 3D view is saved next to it as <name>.3D.png.
+
+
+def plotData(plot_data, data_desc, freq, title, view3D, out_file):
     dim = {}
     desc_n = 0
     desc_n_max = len(data_desc)
+    t_start, (sample_idx, channel_data, strided, bucket_size) = plot_data
 
     # Create a new figure for each .sds file
-    fig = plt.figure()
-    for desc in data_desc:
+    fig = Figure()
+    ax = fig.add_subplot()
+
+    for desc, idx, scaled_data, dim_data in zip(data_desc, sample_idx, channel_data, strided):
         # Extract parameters from description in YAML file
         if "unit" in desc:
             unit = desc["unit"]
         else:
             unit = "raw"
 
-        if "scale" in desc:
-            scale = desc["scale"]
-        else:
-            scale = 1
-
-        if "offset" in desc:
-            offset = desc["offset"]
-        else:
-            offset = 0
-
-        if "type" in desc:
-            d_type = getDataType(desc["type"])
-        else:
-            sys.exit(1)
-
-        # Calculate number of bytes needed for decoding the data in .sds file
-        d_byte = struct.calcsize(d_type)
-        # Disunite raw data into a list of data points according to the number of bytes needed for each data point
-        tmp_data = [all_data[i:(i + d_byte)]
-                    for i in range(0, len(all_data), d_byte)]
-        # Keep only every n-th data point
-        tmp_data = tmp_data[desc_n::desc_n_max]
-        # Decode retrieved data points
-        data = struct.unpack(
-            f"{int(len(tmp_data))}{d_type}", b''.join(tmp_data))
-        # Scale and offset data points
-        scaled_data = [((x * scale) + offset) for x in data]
-
-        # Generate timestamps using number of data points and sampling frequency
-        t = np.arange(0, len(data) / freq, 1 / freq)
-        if len(t) > len(data):
-            # Truncate timestamps to match the number of data points
-            t = t[0:len(data)]
-        plt.plot(t, scaled_data, label=desc["value"])
+        # Generate timestamps using sample index and sampling frequency
+        t = idx * (1 / freq)
+        if t_start != 0:
+            t = t + t_start
+        ax.plot(t, scaled_data, label=desc["value"])
 
         # Store data points in a dictionary for later use when there are 3 axes described
         if view3D and (desc_n_max == 3):
-            dim[desc_n] = scaled_data
+            dim[desc_n] = dim_data
 
         # Increment description number
         desc_n += 1
 
-    plt.grid(linestyle=":")
-    plt.title(title)
-    plt.xlabel("seconds")
-    plt.ylabel(unit)
-    plt.legend()
+    ax.grid(linestyle=":")
+    ax.set_title(title)
+    ax.set_xlabel("seconds")
+    ax.set_ylabel(unit)
+    ax.legend()
+    fig.savefig(out_file)
 
     # Create a 3D view when there are 3 axes available
     if view3D and (desc_n_max == 3):
-        fig3d = plt.figure()
+        fig3d = Figure()
         ax3d = fig3d.add_subplot(projection="3d")
         ax3d.plot(dim[0], dim[1], dim[2])
         ax3d.set_title(f"{title} - 3D")
         ax3d.set_xlabel(f"{data_desc[0]['value']} [{data_desc[0]['unit']}]")
         ax3d.set_ylabel(f"{data_desc[1]['value']} [{data_desc[1]['unit']}]")
         ax3d.set_zlabel(f"{data_desc[2]['value']} [{data_desc[2]['unit']}]")
+        fig3d.savefig(f"{os.path.splitext(out_file)[0]}.3D.png")
 
 # Main function
 
@@ -189,11 +396,19 @@ def main(argv=None):
     required.add_argument("-s", dest="sds", metavar="<sds_file>",
                           help="SDS data recording file", nargs="+", required=True)
     required.add_argument("-o-dir", dest="o_dir", metavar="<sds_file>",
-                          help="output dir", default="sds_out_dir")
+                          help="output dir, plots are saved as <recording>.png", default="sds_out_dir")
 
     optional = parser.add_argument_group("optional")
     optional.add_argument("--3D", dest="view3D",
                           help="Plot 3D view in addition to normal 2D", action="store_true")
+    optional.add_argument("--start", dest="start", metavar="<seconds>",
+                          help="Plot from given time, relative to first record (zoom in to full resolution)",
+                          type=float, default=None)
+    optional.add_argument("--stop", dest="stop", metavar="<seconds>",
+                          help="Plot until given time, relative to first record", type=float, default=None)
+    optional.add_argument("--jobs", dest="jobs", metavar="<jobs>",
+                          help="Number of recordings decoded in parallel (default: %(default)s)",
+                          type=int, default=os.cpu_count() or 1)
 
     args = parser.parse_args(argv)
 
@@ -211,22 +426,47 @@ def main(argv=None):
             f"Error: Sample frequency must be greater than 0 (f = {data_freq})\n")
         sys.exit(0)
 
-    # Record manager
-    Record = RecordManager()
-
-    # Read .sds file/files
-    for arg in args.sds:
-        file = openFile(arg)
-        data = Record.getData(file)
-        closeFile(file)
-        Record.flush()
-
-        # Plot data from .sds file/files
-        plotData(data, data_desc, data_freq, data_name, args.view3D)
+    # Every channel needs a data type for decoding
+    for desc in data_desc:
+        if "type" not in desc:
+            sys.exit(1)
 
-    # Show plotted figures
-    #plt.show()
-    plt.savefig(os.path.join(args.o_dir, 'myplot.png'))
+    # Plots are reduced to about two points per pixel of the figure width
+    n_buckets = int(matplotlib.rcParams["figure.figsize"][0] * matplotlib.rcParams["figure.dpi"])
+
+    os.makedirs(args.o_dir, exist_ok=True)
+
+    # Read .sds file/files, several recordings are decoded in parallel worker
+    # processes and plotted here as their data arrives
+    jobs = max(1, min(args.jobs, len(args.sds)))
+    n_failed = 0
+    with contextlib.ExitStack() as stack:
+        if jobs > 1:
+            setWorkerExecutable()
+            executor = stack.enter_context(ProcessPoolExecutor(max_workers=jobs))
+            futures = [executor.submit(loadPlotData, arg, data_desc, args.start, args.stop, n_buckets)
+                       for arg in args.sds]
+        else:
+            futures = [None] * len(args.sds)
+
+        for arg, future in zip(args.sds, futures):
+            try:
+                if future is not None:
+                    plot_data = future.result()
+                else:
+                    plot_data = loadPlotData(arg, data_desc, args.start, args.stop, n_buckets)
+            except Exception as e:
+                print(f"Error in SdsFile({arg}): {e}")
+                n_failed += 1
+                continue
+
+            # Plot data from .sds file/files
+            out_file = os.path.join(args.o_dir, f"{Path(arg).stem}.png")
+            plotData(plot_data, data_desc, data_freq, data_name, args.view3D, out_file)
+            print(f"{arg} -> {out_file}")
+
+    if n_failed > 0:
+        sys.exit(1)
 
 
 # if __name__ == "__main__":
@@ -0,0 +1,225 @@
+# Checks and microbenchmarks of the sdsio_server stream buffer (ByteStreamBuffer).
+#
+# The checks are deterministic: wraparound at the end of the buffer, partial
+# reads of fewer bytes than requested or buffered, non-blocking writes to a
+# full buffer, EOF and close(), a seeded sequence of writes and reads checked
+# against a plain bytearray, and a seeded producer/consumer run with
+# random write and read sizes around the buffer capacity. The benchmarks
+# stream data from a producer to a consumer thread and drain a backlog.
+#
+#   python -m app.sds_utilities.sdsio_buffer_bench [--check-only]
+
+import argparse
+import random
+import threading
+import time
+
+from .sdsio_server import ByteStreamBuffer
+
+
+class buffer_checks:
+    def __init__(self):
+        self.failed = []
+
+    def expect(self, name, value, expected):
+        if value != expected:
+            self.failed.append(f"{name}: {value!r}, expected {expected!r}")
+
+    # Data written across the end of the buffer comes out in order
+    def wraparound(self):
+        buf = ByteStreamBuffer(10)
+        buf.write(b"0123456")
+        self.expect("read before wrap", buf.read(5), b"01234")
+        buf.write(b"789abc")            # stored as "789" at the end, "abc" at the start
+        self.expect("size after wrap", buf.size, 8)
+        out = bytearray(8)
+        self.expect("readinto across end", buf.readinto(out), 8)
+        self.expect("data across end", bytes(out), b"56789abc")
+        # emptied buffer restarts at the beginning, data stays contiguous
+        self.expect("head of empty buffer", buf.head, 0)
+
+    # Reads return what is buffered, up to the requested size
+    def partial_reads(self):
+        buf = ByteStreamBuffer(16)
+        buf.write(b"abcdef")
+        self.expect("read less than buffered", buf.read(2), b"ab")
+        self.expect("read more than buffered", buf.read(100, timeout=0), b"cdef")
+        self.expect("read empty buffer", buf.read(4, timeout=0), b"")
+        buf.write(b"ghijklmnop")
+        out = bytearray(3)
+        self.expect("readinto smaller target", buf.readinto(out), 3)
+        self.expect("readinto data", bytes(out), b"ghi")
+        out = bytearray(16)
+        n = buf.readinto(memoryview(out)[4:], timeout=0)
+        self.expect("readinto view", bytes(out[4:4 + n]), b"jklmnop")
+
+    # Writes larger than the free space block, or fail without blocking
+    def full_buffer(self):
+        buf = ByteStreamBuffer(8)
+        self.expect("write fitting", buf.write(b"123456"), True)
+        self.expect("non-blocking write too large", buf.write(b"789", block=False), False)
+        self.expect("size after refused write", buf.size, 6)
+        self.expect("non-blocking write fitting", buf.write(b"78", block=False), True)
+        # a write larger than the capacity completes while a reader drains
+        buf = ByteStreamBuffer(8)
+        data = bytes(range(50))
+        out = bytearray()
+        reader = threading.Thread(target=lambda: self.drain(buf, out, 3))
+        reader.start()
+        buf.write(data)
+        buf.set_eof()
+        reader.join()
+        self.expect("write larger than capacity", bytes(out), data)
+
+    # EOF ends reading, close() discards data and releases a blocked writer
+    def eof_and_close(self):
+        buf = ByteStreamBuffer(8)
+        buf.write(b"xy")
+        buf.set_eof()
+        self.expect("read at EOF", buf.read(8), b"xy")
+        self.expect("read after EOF", buf.read(8), b"")
+        buf = ByteStreamBuffer(8)
+        writer = threading.Thread(target=buf.write, args=(bytes(100),))
+        writer.start()
+        time.sleep(0.1)
+        buf.close()
+        writer.join(1)
+        self.expect("writer released by close", writer.is_alive(), False)
+        self.expect("size after close", buf.size, 0)
+
+    # Seeded sequence of writes and reads of random sizes in one thread,
+    # compared with a plain bytearray, so every wraparound position is hit
+    def interleaved(self, trials=20, steps=2000):
+        for trial in range(trials):
+            rnd = random.Random(trial)
+            capacity = rnd.choice([1, 7, 64, 1000])
+            buf = ByteStreamBuffer(capacity)
+            expected = bytearray()
+            for step in range(steps):
+                if rnd.random() < 0.5:
+                    data = bytes(rnd.getrandbits(8) for _ in range(rnd.randint(0, capacity)))
+                    fits = len(expected) + len(data) <= capacity
+                    if buf.write(data, block=False) != fits:
+                        self.failed.append(f"interleaved trial {trial} step {step}: "
+                                           f"non-blocking write of {len(data)} bytes returned {not fits}")
+                        break
+                    if fits:
+                        expected += data
+                else:
+                    n = rnd.randint(1, capacity + 1)
+                    if rnd.random() < 0.5:
+                        chunk = bytearray(n)
+                        data = bytes(chunk[:buf.readinto(chunk, timeout=0)])
+                    else:
+                        data = buf.read(n, timeout=0)
+                    if data != expected[:n]:
+                        self.failed.append(f"interleaved trial {trial} step {step}: "
+                                           f"read of {n} bytes does not match the data written")
+                        break
+                    del expected[:n]
+
+    # Seeded producer/consumer with random sizes around the capacity
+    def producer_consumer(self, trials=20):
+        for trial in range(trials):
+            rnd = random.Random(trial)
+            capacity = rnd.choice([7, 64, 1000, 4096])
+            buf = ByteStreamBuffer(capacity, wakeup_size=rnd.choice([1, 5, 100, 10**6]))
+            data = bytes(rnd.getrandbits(8) for _ in range(50000))
+            out = bytearray()
+            reader = threading.Thread(target=self.drain, args=(buf, out, 2 * capacity, trial))
+            reader.start()
+            pos = 0
+            while pos < len(data):
+                n = rnd.randint(0, 9000)
+                buf.write(rnd.choice([bytes, bytearray, memoryview])(data[pos:pos + n]))
+                pos += n
+            buf.set_eof()
+            reader.join()
+            self.expect(f"producer/consumer trial {trial}", bytes(out) == data, True)
+
+    # Read until EOF with read() and readinto() of random sizes up to max_size
+    @staticmethod
+    def drain(buf, out, max_size, seed=0):
+        rnd = random.Random(seed + 100)
+        while True:
+            if rnd.random() < 0.5:
+                chunk = bytearray(rnd.randint(1, max_size))
+                n = buf.readinto(chunk, timeout=0.01)
+                out.extend(chunk[:n])
+            else:
+                chunk = buf.read(rnd.randint(1, max_size), timeout=0.01)
+                n = len(chunk)
+                out.extend(chunk)
+            if not n and buf.eof:
+                break
+
+    def run(self):
+        for check in (self.wraparound, self.partial_reads, self.full_buffer,
+                      self.eof_and_close, self.interleaved, self.producer_consumer):
+            check()
+        return self.failed
+
+
+# Stream total bytes in writes of write_size to a consumer thread, returns MB/s
+def bench_stream(total, write_size, capacity=16 * 1024 * 1024, wakeup_size=64 * 1024):
+    buf = ByteStreamBuffer(capacity, wakeup_size)
+    data = bytes(write_size)
+    received = [0]
+
+    def consumer():
+        chunk = bytearray(1024 * 1024)
+        while True:
+            n = buf.readinto(chunk, timeout=0.1)
+            received[0] += n
+            if not n and buf.eof:
+                break
+
+    thr = threading.Thread(target=consumer)
+    thr.start()
+    start_time = time.perf_counter()
+    for _ in range(total // write_size):
+        buf.write(data)
+    buf.set_eof()
+    thr.join()
+    return received[0] / (time.perf_counter() - start_time) / 2**20
+
+
+# Drain a backlog of backlog_mb MB in reads of read_size, returns seconds
+def bench_drain(backlog_mb, read_size):
+    buf = ByteStreamBuffer((backlog_mb + 1) * 1024 * 1024)
+    block = bytes(1024 * 1024)
+    for _ in range(backlog_mb):
+        buf.write(block)
+    start_time = time.perf_counter()
+    n = 0
+    while n < backlog_mb * 1024 * 1024:
+        n += len(buf.read(read_size, timeout=0))
+    return time.perf_counter() - start_time
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Checks and microbenchmarks of the sdsio_server stream buffer")
+    parser.add_argument("--check-only", dest="check_only", action="store_true",
+                        help="Run the checks only, without benchmarks")
+    return parser.parse_args(argv)
+
+
+def start(argv=None):
+    args = parse_arguments(argv)
+    failed = buffer_checks().run()
+    for failure in failed:
+        print(f"FAILED {failure}")
+    print(f"Buffer checks: {'FAILED' if failed else 'ok'}")
+    if args.check_only:
+        return 1 if failed else 0
+
+    print(f"stream 4 KB writes, 256 MB:         {bench_stream(256 * 1024 * 1024, 4096):.0f} MB/s")
+    print(f"stream 64 B writes, 16 MB:          {bench_stream(16 * 1024 * 1024, 64):.1f} MB/s")
+    print(f"drain 96 MB backlog in 64 KB reads: {bench_drain(96, 64 * 1024):.3f} s")
+    print(f"drain 16 MB backlog in 4 KB reads:  {bench_drain(16, 4096):.3f} s")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(start())
@@ -0,0 +1,194 @@
+# Load test for the SDS I/O socket server.
+#
+# Simulates a number of boards that record the same streams at the same time:
+# every board connects, opens its streams for writing, sends SDS records
+# (timestamp, size, payload) and closes them again. With --distinct-peers each
+# board connects from its own loopback address, so a server started with
+# "--namespace peer" records every board into a subdirectory of its own.
+# Without namespaces the boards share the output directory and record their
+# streams as "<name>_<board>". With --outdir the recordings written by the
+# server are checked afterwards, --namespace has to match the server.
+# Closed recordings must not take more disk space than their size.
+
+import argparse
+import os
+import os.path as path
+import random
+import socket
+import struct
+import threading
+import time
+
+
+# Disk space a closed recording may take beyond its size (file system blocks)
+ALLOCATION_SLACK = 1024 * 1024
+
+
+def send_request(sock, cmd, sid, arg, data=b''):
+    sock.sendall(struct.pack('<IIII', cmd, sid, arg, len(data)) + data)
+
+
+def recv_exact(sock, size):
+    buf = bytearray()
+    while len(buf) < size:
+        chunk = sock.recv(size - len(buf))
+        if not chunk:
+            raise ConnectionError("Connection closed by server")
+        buf.extend(chunk)
+    return bytes(buf)
+
+
+def recv_response(sock):
+    cmd, sid, arg, size = struct.unpack('<IIII', recv_exact(sock, 16))
+    data = recv_exact(sock, size) if size else b''
+    return cmd, sid, arg, data
+
+
+class simulated_board:
+    def __init__(self, board_id, args):
+        self.board_id = board_id
+        self.args = args
+        self.source_ip = f"127.0.0.{board_id + 2}" if args.distinct_peers else None
+        if args.namespace == "none":
+            self.streams = [f"{name}_{board_id}" for name in args.streams]
+        else:
+            self.streams = args.streams
+        self.local_addr = None
+        self.bytes_sent = {}        # stream name -> bytes sent
+        self.open_time = 0.0
+        self.write_time = 0.0
+        self.error = None
+
+    def run(self):
+        args = self.args
+        rnd = random.Random(self.board_id)
+        try:
+            source = (self.source_ip, 0) if self.source_ip else None
+            sock = socket.create_connection((args.ip, args.port), timeout=60, source_address=source)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self.local_addr = sock.getsockname()
+            # open all streams
+            t0 = time.perf_counter()
+            sids = {}
+            for name in self.streams:
+                send_request(sock, 1, 0, 1, name.encode('utf-8') + b'\0')
+                _, sid, _, _ = recv_response(sock)
+                if sid == 0:
+                    raise RuntimeError(f"Open of stream '{name}' rejected")
+                sids[name] = sid
+                self.bytes_sent[name] = 0
+            self.open_time = time.perf_counter() - t0
+
+            # write records, streams interleaved like on a board
+            payload = bytes(rnd.getrandbits(8) for _ in range(args.record_size))
+            t0 = time.perf_counter()
+            for n in range(args.records):
+                timestamp = int(n * args.interval * 1000)
+                record = struct.pack('<II', timestamp, len(payload)) + payload
+                for name, sid in sids.items():
+                    send_request(sock, 3, sid, 0, record)
+                    self.bytes_sent[name] += len(record)
+                if args.interval:
+                    time.sleep(args.interval)
+
+            # close streams, the ping response tells that the server is done
+            for sid in sids.values():
+                send_request(sock, 2, sid, 0)
+            send_request(sock, 5, 0, 0)
+            recv_response(sock)
+            self.write_time = time.perf_counter() - t0
+            sock.close()
+        except Exception as e:
+            self.error = f"{type(e).__name__}: {e}"
+
+    # Compare the recordings of the server with the data sent
+    def verify(self, out_dir):
+        if self.args.namespace == "peer":
+            ip = self.local_addr[0]
+            rec_dir = path.join(out_dir, ip.replace(':', '_').replace('%', '_'))
+        else:
+            rec_dir = out_dir
+        for name, size in self.bytes_sent.items():
+            found = False
+            idx = 0
+            fname = path.join(rec_dir, f"{name}.{idx}.sds")
+            while path.exists(fname):
+                if path.getsize(fname) == size:
+                    found = True
+                    break
+                idx += 1
+                fname = path.join(rec_dir, f"{name}.{idx}.sds")
+            if not found:
+                return f"no recording of '{name}' with {size} bytes in {rec_dir}"
+            # space reserved while recording has to be released on close
+            st = os.stat(fname)
+            if hasattr(st, "st_blocks") and st.st_blocks * 512 > st.st_size + ALLOCATION_SLACK:
+                return f"{fname} takes {st.st_blocks * 512} bytes on disk for {st.st_size} bytes"
+        return None
+
+
+def parse_arguments(argv=None):
+    def formatter(prog): return argparse.HelpFormatter(
+        prog, max_help_position=41)
+    parser = argparse.ArgumentParser(
+        formatter_class=formatter, description="Load test for the SDS I/O socket server")
+    parser.add_argument("--ipaddr", dest="ip", metavar="<IP>",
+                        help="Server IP address (default: 127.0.0.1)", default="127.0.0.1")
+    parser.add_argument("--port", dest="port", metavar="<TCP Port>",
+                        help="TCP port (default: 5050)", type=int, default=5050)
+    parser.add_argument("-n", "--boards", dest="boards", metavar="<Boards>",
+                        help="Number of simulated boards (default: 32)", type=int, default=32)
+    parser.add_argument("--streams", dest="streams", metavar="<Name>", nargs="+",
+                        help="Stream names opened by every board (default: Accelerometer Microphone)",
+                        default=["Accelerometer", "Microphone"])
+    parser.add_argument("--records", dest="records", metavar="<Records>",
+                        help="Records per stream (default: 1000)", type=int, default=1000)
+    parser.add_argument("--record-size", dest="record_size", metavar="<Bytes>",
+                        help="Payload size of a record (default: 1024)", type=int, default=1024)
+    parser.add_argument("--interval", dest="interval", metavar="<Seconds>",
+                        help="Delay between records, 0 = as fast as possible (default: 0)",
+                        type=float, default=0)
+    parser.add_argument("--distinct-peers", dest="distinct_peers", action="store_true",
+                        help="Connect every board from its own loopback address 127.0.0.<n+2>")
+    parser.add_argument("--namespace", dest="namespace", metavar="<Namespace>",
+                        choices=["none", "peer"],
+                        help="Stream namespace of the server: none or peer (default: none)",
+                        default="none")
+    parser.add_argument("--outdir", dest="out_dir", metavar="<Output dir>",
+                        help="Output directory of the server, to verify the recordings", default=None)
+    return parser.parse_args(argv)
+
+
+def start(argv=None):
+    args = parse_arguments(argv)
+    boards = [simulated_board(n, args) for n in range(args.boards)]
+    threads = [threading.Thread(target=board.run) for board in boards]
+    t0 = time.perf_counter()
+    for thr in threads:
+        thr.start()
+    for thr in threads:
+        thr.join()
+    elapsed = time.perf_counter() - t0
+
+    failed = 0
+    total = 0
+    for board in boards:
+        error = board.error
+        if error is None and args.out_dir:
+            error = board.verify(args.out_dir)
+        sent = sum(board.bytes_sent.values())
+        total += sent
+        if error:
+            failed += 1
+            print(f"Board {board.board_id}: FAILED, {error}")
+        else:
+            rate = sent / board.write_time / 2**20 if board.write_time else 0
+            print(f"Board {board.board_id}: {sent} bytes, {rate:.1f} MB/s, "
+                  f"open {board.open_time * 1000:.1f} ms")
+    print(f"{args.boards} boards, {total / 2**20:.1f} MB in {elapsed:.2f} s "
+          f"({total / elapsed / 2**20:.1f} MB/s), {failed} failed")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(start())
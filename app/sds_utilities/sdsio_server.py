@@ -15,7 +15,9 @@
 # limitations under the License.
 
 import argparse
+import ctypes
 import sys
+import os
 import os.path as path
 import serial
 import ipaddress
@@ -24,105 +26,496 @@ import socket
 import threading
 import time
 import asyncio
+import json
+import socketserver
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from .sds_file import SdsFile
 
 # ---------------------------------------------------------------------------- #
 #           Byte oriented in memory buffer with per-stream flow control        #
 # ---------------------------------------------------------------------------- #
 
+# Capacity of stream buffers: data written by the device and not yet stored in
+# the file
+WRITE_BUFFER_SIZE = 16 * 1024 * 1024
+
+# File buffer of streams played back to the device, read ahead of its requests
+READ_AHEAD_SIZE = 64 * 1024
+
+# Largest amount of data returned by one read request
+READ_REQUEST_LIMIT = 16 * 1024 * 1024
+
+# Waiting file writer is woken up once this much data is buffered
+WRITE_WAKEUP_SIZE = 64 * 1024
+
+# Recordings are written in blocks of this size, aligned to the file offset,
+# with disk space reserved ahead of the data in steps of PREALLOCATE_SIZE
+WRITE_BLOCK_SIZE = 1024 * 1024
+PREALLOCATE_SIZE = 16 * 1024 * 1024
+
 
 class ByteStreamBuffer:
-    def __init__(self, max_size=None):
-        self.buf = bytearray()
+    # Fixed capacity circular buffer. Data is copied into and out of a
+    # preallocated bytearray, so producing and consuming costs only the copy
+    # of the data itself. Waiting readers are woken up once wakeup_size bytes
+    # are buffered (or at EOF), waiting writers once wakeup_size bytes are free.
+    def __init__(self, capacity=1024 * 1024, wakeup_size=1):
+        self.capacity = capacity
+        self.buf = bytearray(capacity)
+        self.view = memoryview(self.buf)
+        self.head = 0       # read position
+        self.size = 0       # number of buffered bytes
+        self.wakeup_size = min(wakeup_size, capacity)
         self.lock = threading.Lock()
         self.data_avail = threading.Condition(self.lock)
+        self.space_avail = threading.Condition(self.lock)
+        self.readers_waiting = 0
+        self.writers_waiting = 0
         self.eof = False
-        self.max_size = max_size
-
-    def write(self, data: bytes):
-        # Block if buffer full (when max_size set), then append data
-        with self.data_avail:
-            if self.max_size:
-                while len(self.buf) + len(data) > self.max_size:
-                    self.data_avail.wait()
-            self.buf.extend(data)
-            self.data_avail.notify_all()
+        self.closed = False
+        # statistics
+        self.writes = 0         # write calls that stored data
+        self.total_in = 0       # bytes stored in total
+        self.stall_time = 0.0   # seconds writers waited for free space
+
+    def write(self, data, block=True) -> bool:
+        # Copy data into the buffer, blocking while it is full. Without block,
+        # nothing is written and False is returned unless all data fits now.
+        # Data is dropped once the buffer is closed.
+        size = len(data)
+        with self.lock:
+            tail = self.head + self.size
+            if tail + size <= self.capacity and not self.closed:
+                # Common case: data fits behind the buffered data without wrapping around
+                self.buf[tail:tail + size] = data
+                self.size += size
+                self.writes += 1
+                self.total_in += size
+                if self.readers_waiting and self.size >= self.wakeup_size:
+                    self.data_avail.notify_all()
+                return True
+            if not block and self.capacity - self.size < size and not self.closed:
+                return False
+            if not isinstance(data, memoryview):
+                data = memoryview(data)
+            self.writes += 1
+            pos = 0
+            while pos < size:
+                if self.size == self.capacity and not self.closed:
+                    stall_start = time.perf_counter()
+                    while self.size == self.capacity and not self.closed:
+                        self.writers_waiting += 1
+                        self.space_avail.wait()
+                        self.writers_waiting -= 1
+                    self.stall_time += time.perf_counter() - stall_start
+                if self.closed:
+                    return True
+                n = min(size - pos, self.capacity - self.size)
+                tail = (self.head + self.size) % self.capacity
+                first = min(n, self.capacity - tail)
+                self.buf[tail:tail + first] = data[pos:pos + first]
+                self.buf[:n - first] = data[pos + first:pos + n]
+                self.size += n
+                self.total_in += n
+                pos += n
+                if self.readers_waiting and self.size >= self.wakeup_size:
+                    self.data_avail.notify_all()
+            return True
+
+    def __wait_data(self, timeout):
+        # Wait for data or EOF, caller holds the lock
+        if not self.size and not self.eof:
+            self.readers_waiting += 1
+            self.data_avail.wait(timeout)
+            self.readers_waiting -= 1
+
+    def readinto(self, b, timeout=None) -> int:
+        # Wait for data or EOF, then copy up to len(b) bytes into 'b'.
+        # Returns number of bytes copied, 0 if no data arrived in time.
+        b = memoryview(b).cast('B')
+        with self.lock:
+            self.__wait_data(timeout)
+            n = min(len(b), self.size)
+            first = min(n, self.capacity - self.head)
+            b[:first] = self.view[self.head:self.head + first]
+            b[first:n] = self.view[:n - first]
+            self.__consume(n)
+            return n
 
     def read(self, amt: int, timeout=None) -> bytes:
         # Wait for data or EOF, then return up to 'amt' bytes
-        with self.data_avail:
-            if not self.buf and not self.eof:
-                self.data_avail.wait(timeout)
-            if not self.buf:
-                return b''
-            chunk = self.buf[:amt]
-            del self.buf[:amt]
-            self.data_avail.notify_all()
-            return bytes(chunk)
+        with self.lock:
+            self.__wait_data(timeout)
+            n = min(amt, self.size)
+            first = min(n, self.capacity - self.head)
+            data = bytes(self.view[self.head:self.head + first])
+            if n > first:
+                data += self.view[:n - first]
+            self.__consume(n)
+            return data
+
+    def __consume(self, n):
+        # Release n bytes at the read position, caller holds the lock
+        self.size -= n
+        # Empty buffer restarts at the beginning, keeping later data contiguous
+        self.head = (self.head + n) % self.capacity if self.size else 0
+        if self.writers_waiting and self.capacity - self.size >= self.wakeup_size:
+            self.space_avail.notify_all()
 
     def set_eof(self):
         # Signal end-of-file and wake any waiting readers
-        with self.data_avail:
+        with self.lock:
+            self.eof = True
+            self.data_avail.notify_all()
+
+    def close(self):
+        # Discard buffered data and release writers blocked on a full buffer
+        with self.lock:
+            self.closed = True
             self.eof = True
+            self.size = 0
+            self.head = 0
             self.data_avail.notify_all()
+            self.space_avail.notify_all()
+
+# ---------------------------------------------------------------------------- #
+#                                  Statistics                                  #
+# ---------------------------------------------------------------------------- #
+
+
+class LatencyHistogram:
+    # Request latencies counted in power-of-two buckets of microseconds
+    BUCKETS = 24
+
+    def __init__(self):
+        self.counts = [0] * self.BUCKETS
+
+    def add(self, seconds, count=1):
+        self.counts[min(int(seconds * 1e6).bit_length(), self.BUCKETS - 1)] += count
+
+    def bound(self, i):
+        return f"<{1 << i}us" if i < self.BUCKETS - 1 else f">={1 << (i - 1)}us"
+
+    def percentile(self, q):
+        # upper bound of the bucket holding the q-th percentile
+        total = sum(self.counts)
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if n and seen >= q * total / 100:
+                return self.bound(i)
+        return "-"
+
+    def to_dict(self):
+        return {self.bound(i): n for i, n in enumerate(self.counts) if n}
+
+
+class ConnectionStats:
+    # Traffic and request latencies of one client connection
+    def __init__(self, peer):
+        self.peer = peer
+        self.opened = time.time()
+        self.requests = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.latency = LatencyHistogram()
+
+    def to_dict(self):
+        return {
+            "peer": self.peer,
+            "duration": round(time.time() - self.opened, 3),
+            "requests": self.requests,
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "latency_us": self.latency.to_dict(),
+        }
+
+
+class StreamStats:
+    # Counters of one open stream. Data received for a write stream is counted
+    # by its ByteStreamBuffer, data stored in the file by the writer.
+    def __init__(self, name, namespace, mode, buf=None):
+        self.name = name
+        self.namespace = namespace
+        self.mode = mode
+        self.buf = buf
+        self.opened = time.time()
+        self.bytes_written = 0
+        self.reads = 0
+        self.bytes_out = 0
+
+    def to_dict(self):
+        duration = max(time.time() - self.opened, 1e-3)
+        stats = {
+            "name": self.name,
+            "namespace": self.namespace,
+            "mode": "write" if self.mode == 1 else "read",
+            "duration": round(duration, 3),
+        }
+        buf = self.buf
+        if buf is not None:
+            stats.update({
+                "writes": buf.writes,
+                "writes_per_s": round(buf.writes / duration, 1),
+                "bytes_in": buf.total_in,
+                "bytes_in_per_s": round(buf.total_in / duration),
+                "bytes_written": self.bytes_written,
+                "backlog": buf.size,
+                "writer_lag": buf.total_in - self.bytes_written,
+                "stall_time": round(buf.stall_time, 3),
+            })
+        else:
+            stats.update({
+                "reads": self.reads,
+                "bytes_out": self.bytes_out,
+                "bytes_out_per_s": round(self.bytes_out / duration),
+            })
+        return stats
+
+
+# ---------------------------------------------------------------------------- #
+#                              Stream Subscribers                              #
+# ---------------------------------------------------------------------------- #
+
+
+class StreamSubscriber:
+    # Live feed of the streams written to the server. The manager queues
+    # events (event, sid, name, data) with event "open", "data" or "close";
+    # name includes the namespace ("<namespace>/<name>"), data is set for
+    # "data" only. put() never blocks, so a slow consumer cannot hold up the
+    # recording: once max_chunks data chunks are queued, policy "drop_old"
+    # drops the oldest queued chunk, "drop_new" the incoming one. Open and
+    # close events are never dropped. Where chunks of a stream went missing,
+    # the consumer gets a ("gap", sid, name, <number of chunks>) event.
+    # streams optionally limits the feed to the given stream names.
+    def __init__(self, max_chunks=1024, policy="drop_old", streams=None, name="subscriber"):
+        self.max_chunks = max_chunks
+        self.policy = policy
+        self.streams = set(streams) if streams else None
+        self.name = name
+        self.events = deque()
+        self.cond = threading.Condition()
+        self.n_chunks = 0       # data chunks queued
+        self.missing = {}       # sid -> chunks dropped before its queued events (drop_old)
+        self.tail_gap = {}      # sid -> gap event queued last for the stream (drop_new)
+        self.dropped = 0
+        self.closed = False
+
+    def put(self, event):
+        kind, sid = event[0], event[1]
+        with self.cond:
+            if self.closed:
+                return
+            if kind == "data" and self.n_chunks >= self.max_chunks:
+                self.dropped += 1
+                if self.policy == "drop_new":
+                    gap = self.tail_gap.get(sid)
+                    if gap is None:
+                        gap = ["gap", sid, event[2], 0]
+                        self.tail_gap[sid] = gap
+                        self.events.append(gap)
+                    gap[3] += 1
+                    self.cond.notify()
+                    return
+                # the oldest chunk is also the oldest of its stream, so the
+                # gap is reported before the next event of that stream
+                for i, old in enumerate(self.events):
+                    if old[0] == "data":
+                        del self.events[i]
+                        self.n_chunks -= 1
+                        self.missing[old[1]] = self.missing.get(old[1], 0) + 1
+                        break
+            self.tail_gap.pop(sid, None)
+            self.events.append(event)
+            if kind == "data":
+                self.n_chunks += 1
+            self.cond.notify()
+
+    def get(self, timeout=None):
+        # Next event, None if none arrived within timeout or when closed
+        with self.cond:
+            while not self.events:
+                if self.closed or not self.cond.wait(timeout):
+                    return None
+            event = self.events[0]
+            kind, sid = event[0], event[1]
+            if kind != "open" and sid in self.missing:
+                return ("gap", sid, event[2], self.missing.pop(sid))
+            self.events.popleft()
+            if kind == "data":
+                self.n_chunks -= 1
+            elif kind == "gap":
+                if self.tail_gap.get(sid) is event:
+                    del self.tail_gap[sid]
+                event = tuple(event)
+            return event
+
+    def close(self):
+        # Stop the feed, wakes up a waiting get()
+        with self.cond:
+            self.closed = True
+            self.events.clear()
+            self.cond.notify_all()
+
+
+# Write the sidecar record index of a finished recording (see SdsFile)
+def index_recording(fname):
+    try:
+        SdsFile(fname, save_index=True).close()
+    except Exception as e:
+        print(f"Index of '{fname}' not written: {e}")
+
 
 # ---------------------------------------------------------------------------- #
 #                                 SDS IO Manager                                #
 # ---------------------------------------------------------------------------- #
 
 
+# Reserve disk space for the file of fd up to 'size' bytes without changing
+# the file size, so the recording is laid out in large extents while readers
+# (and a crashed server) only ever see the data really written. Returns the
+# new reserved size, or None if not supported.
+def preallocate_file(fd, allocated, size):
+    try:
+        if sys.platform.startswith("linux"):
+            libc = ctypes.CDLL(None, use_errno=True)
+            libc.fallocate.argtypes = [ctypes.c_int, ctypes.c_int, ctypes.c_longlong, ctypes.c_longlong]
+            FALLOC_FL_KEEP_SIZE = 1
+            if libc.fallocate(fd, FALLOC_FL_KEEP_SIZE, allocated, size - allocated) != 0:
+                return None
+        elif sys.platform == "win32":
+            import msvcrt
+
+            class FILE_ALLOCATION_INFO(ctypes.Structure):
+                _fields_ = [("AllocationSize", ctypes.c_longlong)]
+
+            FileAllocationInfo = 5
+            info = FILE_ALLOCATION_INFO(size)
+            if not ctypes.windll.kernel32.SetFileInformationByHandle(
+                    msvcrt.get_osfhandle(fd), FileAllocationInfo, ctypes.byref(info), ctypes.sizeof(info)):
+                return None
+        else:
+            return None
+        return size
+    except (OSError, AttributeError):
+        return None
+
+
+def stream_label(name, namespace):
+    return f"{namespace}/{name}" if namespace else name
+
+
 class sdsio_manager:
-    def __init__(self, out_dir):
+    def __init__(self, out_dir, fsync_policy="never"):
         self.stream_id = 0
+        # "never", "close" or sync every <n> MB (and on close)
+        self.fsync_policy = fsync_policy
         self.out_dir = path.normpath(out_dir)
-        self.opened_streams = {}    # sid -> (file_obj, name, mode)
+        self.opened_streams = {}    # sid -> (file_obj, name, mode, namespace)
+        self.stream_keys = {}       # (namespace, name) -> sid of the open stream
+        self.next_index = {}        # (namespace, name) -> next file index to try
+        self.stream_stats = {}      # sid -> StreamStats
+        self.connections = set()    # ConnectionStats of connected clients
+        self.subscribers = []       # StreamSubscriber, list replaced on change
+        self.started = time.time()
         # write side
         self.write_buffers = {}     # sid -> ByteStreamBuffer
         self.write_threads = {}     # sid -> Thread
         self.write_stop = {}        # sid -> Event
-        # read side
-        self.read_buffers = {}      # sid -> ByteStreamBuffer
-        self.read_threads = {}      # sid -> Thread
-        self.read_stop = {}         # sid -> Event
-        # lock to protect stream_id increment and open checks
+        # lock to protect stream_id increment, open checks and the stream
+        # tables, requests of different clients run in different threads
         self.manager_lock = threading.Lock()
 
+    # Directory of a namespace (e.g. one per device), created on first use.
+    # Streams without namespace are kept in out_dir.
+    def __namespace_dir(self, namespace):
+        if not namespace:
+            return self.out_dir
+        ns_dir = path.join(self.out_dir, namespace)
+        os.makedirs(ns_dir, exist_ok=True)
+        return ns_dir
+
+    # Directory a stream is read from: the namespace directory if it holds
+    # recordings of the stream, out_dir otherwise, so streams to play back
+    # can be shared by all boards.
+    def __read_dir(self, namespace, name):
+        if namespace:
+            ns_dir = path.join(self.out_dir, namespace)
+            if path.exists(path.join(ns_dir, f"{name}.0.sds")):
+                return ns_dir
+        return self.out_dir
+
+    # Create the next free "<name>.<idx>.sds" file. Exclusive creation makes
+    # the allocation atomic, also against other processes sharing the
+    # directory; the cached index avoids probing all earlier recordings.
+    def __create_stream_file(self, out_dir, key, name):
+        idx = self.next_index.get(key, 0)
+        while True:
+            fname = path.join(out_dir, f"{name}.{idx}.sds")
+            try:
+                f = open(fname, "xb", buffering=0)
+                break
+            except FileExistsError:
+                idx += 1
+        self.next_index[key] = idx + 1
+        return f
+
     def _file_write_worker(self, sid, file_obj, buf: ByteStreamBuffer, stop_evt):
-        chunk_size = 64 * 1024
+        # Buffered data is collected into blocks ending on WRITE_BLOCK_SIZE
+        # boundaries of the file, each written with a single call; a partial
+        # block is written only when the stream goes idle or ends. Disk space
+        # is reserved in PREALLOCATE_SIZE steps ahead of the data, without
+        # extending the file beyond the data written; the space still reserved
+        # is released when the stream ends.
+        block = bytearray(WRITE_BLOCK_SIZE)
+        view = memoryview(block)
+        fd = file_obj.fileno()
+        stats = self.stream_stats[sid]
+        pos = 0             # bytes written to the file
+        fill = 0            # bytes collected in block
+        allocated = 0       # preallocated file size, None if not supported
+        synced = 0
+        sync_step = self.fsync_policy * 1024 * 1024 if isinstance(self.fsync_policy, int) else 0
         try:
             while True:
-                data = buf.read(chunk_size, timeout=0.1)
-                if data:
-                    file_obj.write(data)
+                eof = buf.eof
+                limit = WRITE_BLOCK_SIZE - pos % WRITE_BLOCK_SIZE
+                n = buf.readinto(view[fill:limit], timeout=0.1)
+                fill += n
+                if n and fill < limit:
                     continue
-                # on EOF, drain any remaining data then exit
-                if buf.eof:
-                    while True:
-                        data = buf.read(chunk_size, timeout=0)
-                        if not data:
-                            break
-                        file_obj.write(data)
+                if fill:
+                    if allocated is not None and pos + fill > allocated:
+                        allocated = preallocate_file(fd, allocated, pos + fill + PREALLOCATE_SIZE)
+                    done = 0
+                    while done < fill:
+                        done += file_obj.write(view[done:fill])
+                    pos += fill
+                    fill = 0
+                    stats.bytes_written = pos
+                    if sync_step and pos - synced >= sync_step:
+                        os.fsync(fd)
+                        synced = pos
+                # buffer was empty after EOF was set: all data is written
+                if eof and not n:
                     break
         except Exception as e:
             print(f"[Writer {sid}] error: {e}")
         finally:
+            try:
+                # truncating to the bytes written frees the reserved blocks
+                if allocated:
+                    os.ftruncate(fd, os.fstat(fd).st_size)
+                if self.fsync_policy != "never":
+                    os.fsync(fd)
+            except OSError as e:
+                print(f"[Writer {sid}] error: {e}")
             file_obj.close()
 
-    def _file_read_worker(self, sid, file_obj, buf: ByteStreamBuffer, stop_evt):
-        chunk_size = 128 * 1024
-        try:
-            while not stop_evt.is_set():
-                data = file_obj.read(chunk_size)
-                if data:
-                    buf.write(data)
-                else:
-                    buf.set_eof()
-                    break
-        except Exception as e:
-            print(f"[Reader {sid}] error: {e}")
-        finally:
-            file_obj.close()
-
-    def __open(self, mode, name):
+    def __open(self, mode, name, namespace=None):
         print(f"mode: {mode}, {name}\n")
         cmd = 1
         # prepare error response
@@ -142,68 +535,47 @@ class sdsio_manager:
             print(f"Invalid stream name: {name}")
             return resp_err
 
-        # ensure not already open
-        for (_, n, _) in self.opened_streams.values():
-            if n == name:
+        # check, allocate and register the stream atomically, so concurrent
+        # clients cannot open the same stream or file
+        key = (namespace, name)
+        with self.manager_lock:
+            # ensure not already open in this namespace
+            if key in self.stream_keys:
                 print(f"Stream '{name}' is already opened, cannot open again.")
                 return resp_err
+            try:
+                if mode == 1:
+                    f = self.__create_stream_file(self.__namespace_dir(namespace), key, name)
+                else:
+                    f = self.__open_read_file(self.__read_dir(namespace, name), name)
+            except OSError as e:
+                print(f"Stream '{name}' cannot be opened: {e}")
+                return resp_err
 
-        # allocate new sid
-        with self.manager_lock:
+            # allocate new sid
             self.stream_id += 1
             sid = self.stream_id
+            self.opened_streams[sid] = (f, name, mode, namespace)
+            self.stream_keys[key] = sid
 
-        # mode 1 = write, 0 = read
-        if mode == 1:
-            # write mode: find next filename and start writer thread
-            idx = 0
-            fname = path.join(self.out_dir, f"{name}.{idx}.sds")
-            while path.exists(fname):
-                idx += 1
-                fname = path.join(self.out_dir, f"{name}.{idx}.sds")
-            f = open(fname, "wb")
-            self.opened_streams[sid] = (f, name, mode)
-            buf = ByteStreamBuffer(max_size=100 * 1024 * 1024)  # 100 MB
-            stop_evt = threading.Event()
-            thr = threading.Thread(
-                target=self._file_write_worker,
-                args=(sid, f, buf, stop_evt),
-                daemon=True
-            )
-            thr.start()
-            self.write_buffers[sid] = buf
-            self.write_threads[sid] = thr
-            self.write_stop[sid] = stop_evt
-
-        else:
-            # read mode: determine file, update index, start reader thread
-            idx = 0
-            index_file = path.join(self.out_dir, f"{name}.index.txt")
-            if path.exists(index_file):
-                with open(index_file, "r") as ix:
-                    line = ix.readline().strip()
-                    if line.isdigit():
-                        idx = int(line)
-            fname = path.join(self.out_dir, f"{name}.{idx}.sds")
-            if not path.exists(fname) and idx != 0:
-                idx = 0
-                fname = path.join(self.out_dir, f"{name}.{idx}.sds")
-            with open(index_file, "w") as ix:
-                ix.write(str(idx + 1 if path.exists(fname) else idx))
-            f = open(fname, "rb")
-            self.opened_streams[sid] = (f, name, mode)
-
-            buf = ByteStreamBuffer()
-            stop_evt = threading.Event()
-            thr = threading.Thread(
-                target=self._file_read_worker,
-                args=(sid, f, buf, stop_evt),
-                daemon=True
-            )
-            thr.start()
-            self.read_buffers[sid] = buf
-            self.read_threads[sid] = thr
-            self.read_stop[sid] = stop_evt
+            # mode 1 = write, 0 = read
+            if mode == 1:
+                # write mode: start writer thread
+                buf = ByteStreamBuffer(WRITE_BUFFER_SIZE, wakeup_size=WRITE_WAKEUP_SIZE)
+                self.stream_stats[sid] = StreamStats(name, namespace, mode, buf)
+                stop_evt = threading.Event()
+                thr = threading.Thread(
+                    target=self._file_write_worker,
+                    args=(sid, f, buf, stop_evt),
+                    daemon=True
+                )
+                thr.start()
+                self.write_buffers[sid] = buf
+                self.write_threads[sid] = thr
+                self.write_stop[sid] = stop_evt
+            else:
+                # read mode: requests are served from the file directly
+                self.stream_stats[sid] = StreamStats(name, namespace, mode)
 
         # build success response
         resp = bytearray()
@@ -211,29 +583,60 @@ class sdsio_manager:
         resp.extend(sid.to_bytes(4, 'little'))
         resp.extend(mode.to_bytes(4, 'little'))
         resp.extend((0).to_bytes(4, 'little'))
+        if mode == 1 and self.subscribers:
+            self.publish("open", sid)
         print(f"Stream opened: '{self.opened_streams[sid][1]}'.")
         return resp
 
+    # Determine the file to play back, update the index and open the file
+    def __open_read_file(self, out_dir, name):
+        idx = 0
+        index_file = path.join(out_dir, f"{name}.index.txt")
+        if path.exists(index_file):
+            with open(index_file, "r") as ix:
+                line = ix.readline().strip()
+                if line.isdigit():
+                    idx = int(line)
+        fname = path.join(out_dir, f"{name}.{idx}.sds")
+        if not path.exists(fname) and idx != 0:
+            idx = 0
+            fname = path.join(out_dir, f"{name}.{idx}.sds")
+        f = open(fname, "rb", buffering=READ_AHEAD_SIZE)
+        with open(index_file, "w") as ix:
+            ix.write(str(idx + 1))
+        return f
+
     def __close(self, sid):
         resp = bytearray()
-        name = self.opened_streams[sid][1]
+        # unregister buffers and threads, the (slow) joins run outside the lock
+        with self.manager_lock:
+            entry = self.opened_streams.get(sid)
+            write_buf = self.write_buffers.pop(sid, None)
+            write_thr = self.write_threads.pop(sid, None)
+            write_stop = self.write_stop.pop(sid, None)
+        if entry is None:
+            print(f"Stream not opened: {sid}")
+            return resp
+        name = entry[1]
         # clean up writer side
-        if sid in self.write_buffers:
-            buf = self.write_buffers.pop(sid)
-            buf.set_eof()
-            self.write_stop[sid].set()
-            self.write_threads[sid].join()
-            self.write_threads.pop(sid)
-            self.write_stop.pop(sid)
+        if write_buf is not None:
+            if self.subscribers:
+                self.publish("close", sid)
+            write_buf.set_eof()
+            write_stop.set()
+            write_thr.join()
+            # index the finished recording in the background, so readers do
+            # not have to scan it and the client is not held up by the scan
+            threading.Thread(target=index_recording, args=(entry[0].name,),
+                             name=f"sdsio_index_{sid}").start()
         # clean up reader side
-        if sid in self.read_buffers:
-            self.read_stop[sid].set()
-            self.read_threads[sid].join()
-            self.read_buffers.pop(sid)
-            self.read_threads.pop(sid)
-            self.read_stop.pop(sid)
+        if entry[2] == 0:
+            entry[0].close()
         # unregister stream
-        self.opened_streams.pop(sid, None)
+        with self.manager_lock:
+            self.opened_streams.pop(sid, None)
+            self.stream_keys.pop((entry[3], name), None)
+            self.stream_stats.pop(sid, None)
         print(f"Stream closed: {name}.")
         return resp
 
@@ -244,13 +647,13 @@ class sdsio_manager:
             print(f"Not opened for write: {sid}")
             return resp
         buf.write(data)
+        if self.subscribers:
+            self.publish("data", sid, data)
         return resp
 
     def __read(self, sid, size):
         resp = bytearray()
         cmd = 4
-        eof = 0
-        data = bytearray()
         entry = self.opened_streams.get(sid)
         # invalid read
         if not entry or entry[2] != 0:
@@ -260,14 +663,15 @@ class sdsio_manager:
             resp.extend((0).to_bytes(4, 'little'))
             return resp
 
-        buf = self.read_buffers.get(sid)
-        # read until requested size or EOF
-        while len(data) < size:
-            chunk = buf.read(size - len(data), timeout=0.05)
-            if not chunk:
-                break
-            data.extend(chunk)
-        if not data and buf.eof:
+        # read up to size bytes at the current file position, EOF is reported
+        # once no data is left
+        f = entry[0]
+        try:
+            data = f.read(min(size, READ_REQUEST_LIMIT))
+            eof = 1 if not data and (size or not f.peek(1)) else 0
+        except (OSError, ValueError) as e:
+            print(f"Read error on stream {sid}: {e}")
+            data = b''
             eof = 1
         resp.extend(cmd.to_bytes(4, 'little'))
         resp.extend(sid.to_bytes(4, 'little'))
@@ -275,6 +679,10 @@ class sdsio_manager:
         resp.extend(len(data).to_bytes(4, 'little'))
         if data:
             resp.extend(data)
+        stats = self.stream_stats.get(sid)
+        if stats is not None:
+            stats.reads += 1
+            stats.bytes_out += len(data)
         return resp
 
     def __pingServer(self, sid):
@@ -287,14 +695,68 @@ class sdsio_manager:
         print("Ping received. Connection is active.")
         return resp
 
-    def execute_request(self, buf: bytes):
+    def add_connection(self, conn: ConnectionStats):
+        with self.manager_lock:
+            self.connections.add(conn)
+
+    def remove_connection(self, conn: ConnectionStats):
+        with self.manager_lock:
+            self.connections.discard(conn)
+
+    def subscribe(self, subscriber: StreamSubscriber):
+        # the subscriber learns about streams already being recorded first
+        with self.manager_lock:
+            for sid, (_, name, mode, namespace) in self.opened_streams.items():
+                if mode == 1 and (subscriber.streams is None or name in subscriber.streams):
+                    subscriber.put(("open", sid, stream_label(name, namespace), None))
+            self.subscribers = self.subscribers + [subscriber]
+
+    def unsubscribe(self, subscriber: StreamSubscriber):
+        with self.manager_lock:
+            self.subscribers = [sub for sub in self.subscribers if sub is not subscriber]
+
+    # Hand an event of a write stream to all subscribers. Data may be a view
+    # into a receive buffer, so it is copied once; all subscribers share the
+    # copy.
+    def publish(self, event, sid, data=None):
+        entry = self.opened_streams.get(sid)
+        if entry is None:
+            return
+        name = entry[1]
+        if data is not None and not isinstance(data, bytes):
+            data = bytes(data)
+        item = (event, sid, stream_label(name, entry[3]), data)
+        for sub in self.subscribers:
+            if sub.streams is None or name in sub.streams:
+                sub.put(item)
+
+    # Snapshot of the counters of all open streams and connections
+    def stats(self):
+        with self.manager_lock:
+            streams = list(self.stream_stats.items())
+            connections = list(self.connections)
+        return {
+            "uptime": round(time.time() - self.started, 3),
+            "streams": [dict(sid=sid, **st.to_dict()) for sid, st in streams],
+            "connections": [conn.to_dict() for conn in connections],
+            "subscribers": [{"name": sub.name, "queued": sub.n_chunks, "dropped": sub.dropped}
+                            for sub in self.subscribers],
+        }
+
+    # Close streams left open, e.g. by a client that disconnected
+    def close_streams(self, sids):
+        for sid in sids:
+            if sid in self.opened_streams:
+                self.__close(sid)
+
+    def execute_request(self, buf: bytes, namespace=None):
         cmd = int.from_bytes(buf[0:4], 'little')
         sid = int.from_bytes(buf[4:8], 'little')
         arg = int.from_bytes(buf[8:12], 'little')
         sz = int.from_bytes(buf[12:16], 'little')
         data = buf[16:16+sz]
         if cmd == 1:
-            return self.__open(arg, data.decode('utf-8').rstrip('\0'))
+            return self.__open(arg, bytes(data).decode('utf-8').rstrip('\0'), namespace)
         elif cmd == 2:
             return self.__close(sid)
         elif cmd == 3:
@@ -307,33 +769,179 @@ class sdsio_manager:
             print(f"Unknown command: {cmd}")
             return bytearray()
 
+    def try_execute_request(self, buf: bytes):
+        # Execute requests that complete without blocking: pings, and writes
+        # whose data fits into the stream buffer right away. Returns None if
+        # the request has to be run with execute_request(), which may block.
+        cmd = int.from_bytes(buf[0:4], 'little')
+        if cmd == 5:
+            return self.execute_request(buf)
+        if cmd == 3:
+            sid = int.from_bytes(buf[4:8], 'little')
+            sz = int.from_bytes(buf[12:16], 'little')
+            stream_buf = self.write_buffers.get(sid)
+            if stream_buf is not None and stream_buf.write(buf[16:16+sz], block=False):
+                if self.subscribers:
+                    self.publish("data", sid, buf[16:16+sz])
+                return bytearray()
+        return None
+
+# ---------------------------------------------------------------------------- #
+#                               Request Framing                                 #
+# ---------------------------------------------------------------------------- #
+
+# Initial size of the receive buffer of a connection, grows for requests that
+# do not fit. Processed requests are moved out of the buffer only once this
+# many bytes have been consumed, not after every request.
+REQUEST_BUFFER_SIZE = 256 * 1024
+REQUEST_COMPACT_SIZE = 64 * 1024
+
+
+class RequestFramer:
+    # Splits received data into requests: a 16-byte header, in which bytes
+    # [12:16] encode the payload size, followed by the payload. Data is kept in
+    # buf[start:end] of a reusable buffer and requests are returned as
+    # memoryviews into it, valid until the next call of feed().
+    def __init__(self, size=REQUEST_BUFFER_SIZE):
+        self.buf = bytearray(size)
+        self.view = memoryview(self.buf)
+        self.start = 0
+        self.end = 0
+
+    def feed(self, data):
+        size = len(data)
+        if self.end + size > len(self.buf):
+            # no space left behind the pending data: move it to the front,
+            # or grow the buffer if it cannot hold the pending request
+            pending = self.end - self.start
+            if pending + size > len(self.buf):
+                buf = bytearray(max(2 * len(self.buf), pending + size))
+                buf[:pending] = self.buf[self.start:self.end]
+                self.buf = buf
+                self.view = memoryview(buf)
+            else:
+                self.buf[:pending] = self.buf[self.start:self.end]
+            self.start = 0
+            self.end = pending
+        self.view[self.end:self.end + size] = data
+        self.end += size
+
+    def requests(self):
+        # Yield all complete requests received so far
+        view = self.view
+        while self.end - self.start >= 16:
+            req_len = 16 + int.from_bytes(view[self.start + 12:self.start + 16], 'little')
+            if self.end - self.start < req_len:
+                break  # Wait for more data.
+            start = self.start
+            self.start += req_len
+            yield view[start:start + req_len]
+        if self.start == self.end:
+            self.start = self.end = 0
+        elif self.start >= REQUEST_COMPACT_SIZE:
+            pending = self.end - self.start
+            self.buf[:pending] = self.buf[self.start:self.end]
+            self.start = 0
+            self.end = pending
+
 # ---------------------------------------------------------------------------- #
 #                            Async Socket Server                               #
 # ---------------------------------------------------------------------------- #
 
 
+# Largest amount of received data taken from a socket at once
+SOCKET_READ_SIZE = 256 * 1024
+
+
 class async_sdsio_server_socket:
-    def __init__(self, ip, port, manager: sdsio_manager):
+    def __init__(self, ip, port, manager: sdsio_manager, namespace="none"):
         self.ip = ip
         self.port = port
         self.manager = manager
+        self.namespace = namespace
+
+    # Namespace of the streams of a client: "peer" records each board into a
+    # subdirectory named after its IP address, so boards can use the same
+    # stream names at the same time and keep their recordings across
+    # connections.
+    def client_namespace(self, peer):
+        if self.namespace != "peer" or not peer:
+            return None
+        return str(peer[0]).replace(':', '_').replace('%', '_')
 
     async def handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        # Requests of each client run in order in a worker thread of its own.
+        # Blocking manager work (opening files, joining writers on close, full
+        # stream buffers, waiting reads) then stalls only this client and not
+        # the event loop serving the others. Requests that cannot block run
+        # directly on the event loop.
+        # All complete requests received are processed as a batch and their
+        # responses sent with one write; the client is only waited for when
+        # the transport buffers more than its high-water mark.
+        loop = asyncio.get_running_loop()
+        executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sdsio_client")
+        namespace = self.client_namespace(writer.get_extra_info("peername"))
+        opened = set()  # streams of this client, closed when it disconnects
+        framer = RequestFramer()
+        transport = writer.transport
+        high_water = transport.get_write_buffer_limits()[1]
+        peer = writer.get_extra_info("peername")
+        conn = ConnectionStats(f"{peer[0]}:{peer[1]}" if peer else "socket")
+        self.manager.add_connection(conn)
         try:
             while True:
-                # read fixed-size header, then payload
-                hdr = await reader.readexactly(16)
-                sz = int.from_bytes(hdr[12:16], 'little')
-                pl = await reader.readexactly(sz) if sz > 0 else b''
-                resp = self.manager.execute_request(hdr + pl)
-                if resp:
-                    writer.write(resp)
+                data = await reader.read(SOCKET_READ_SIZE)
+                if not data:
+                    print("Client disconnected.")
+                    break
+                # latency of a request: from receiving its data until its
+                # response is sent, recorded for all requests of a batch at once
+                t_start = time.perf_counter()
+                conn.bytes_in += len(data)
+                framer.feed(data)
+                out = bytearray()
+                batched = 0
+                for req in framer.requests():
+                    cmd = int.from_bytes(req[0:4], 'little')
+                    resp = self.manager.try_execute_request(req)
+                    if resp is None:
+                        # send responses of earlier requests before waiting
+                        if out:
+                            writer.write(out)
+                            conn.bytes_out += len(out)
+                            out = bytearray()
+                        if batched:
+                            conn.requests += batched
+                            conn.latency.add(time.perf_counter() - t_start, batched)
+                            batched = 0
+                        resp = await loop.run_in_executor(executor, self.manager.execute_request, req, namespace)
+                    batched += 1
+                    if cmd == 1 and resp:
+                        sid = int.from_bytes(resp[4:8], 'little')
+                        if sid:
+                            opened.add(sid)
+                    elif cmd == 2:
+                        opened.discard(int.from_bytes(req[4:8], 'little'))
+                    if resp:
+                        out += resp
+                if out:
+                    writer.write(out)
+                    conn.bytes_out += len(out)
+                if batched:
+                    conn.requests += batched
+                    conn.latency.add(time.perf_counter() - t_start, batched)
+                if transport.get_write_buffer_size() > high_water:
                     await writer.drain()
-        except (asyncio.IncompleteReadError, ConnectionResetError, OSError) as e:
+        except (ConnectionResetError, OSError) as e:
             print(f"Client disconnected: {e}")
         except Exception as e:
             print(f"Error in handle_client: {e}")
         finally:
+            self.manager.remove_connection(conn)
+            if opened:
+                print(f"Closing {len(opened)} stream(s) left open by the client.")
+                await loop.run_in_executor(executor, self.manager.close_streams, opened)
+            executor.shutdown(wait=False)
             writer.close()
             await writer.wait_closed()
 
@@ -349,14 +957,20 @@ class async_sdsio_server_socket:
 # ---------------------------------------------------------------------------- #
 
 
+# Longest time a serial read blocks while the device is idle
+SERIAL_READ_TIMEOUT = 0.1
+
+
 class sdsio_server_serial:
-    def __init__(self, port, baudrate, parity, stop_bits, connect_timeout, manager: sdsio_manager):
+    def __init__(self, port, baudrate, parity, stop_bits, connect_timeout, manager: sdsio_manager,
+                 namespace="none"):
         self.port = port
         self.baudrate = baudrate
         self.parity = parity
         self.stop_bits = stop_bits
         self.connect_timeout = connect_timeout
         self.manager = manager
+        self.namespace = namespace
         self.ser = None
 
     def open(self):
@@ -373,7 +987,7 @@ class sdsio_server_serial:
             self.ser.baudrate = self.baudrate
             self.ser.parity = self.parity
             self.ser.stopbits = self.stop_bits
-            self.ser.timeout = 0
+            self.ser.timeout = SERIAL_READ_TIMEOUT
         except Exception as e:
             #print(f"Error initializing serial.Serial: {e}")
             #sys.exit(1)
@@ -397,9 +1011,12 @@ class sdsio_server_serial:
         except Exception:
             pass
 
+    # Wait for data (at most SERIAL_READ_TIMEOUT), then return all data that
+    # has arrived, up to size bytes, without waiting for more.
     def read(self, size):
         try:
-            return self.ser.read(size)
+            waiting = self.ser.in_waiting
+            return self.ser.read(min(max(waiting, 1), size))
         except Exception as e:
             print(f"Serial read error: {e}")
             #sys.exit(1)
@@ -420,8 +1037,21 @@ class sdsio_server_serial:
         print("Click BTN1 on NuMaker board to start recording.")
         print("Click BTN1 on NuMaker board again to close recording.")
         print("Disconnect the USB to release the server service.")
-        buffer = bytearray()
-        read_fail_count = 0
+        # Requests are handed to the manager as memoryviews into the receive
+        # buffer, without copying them.
+        framer = RequestFramer()
+        conn = ConnectionStats(self.port)
+        self.manager.add_connection(conn)
+        # "port" records into a subdirectory named after the serial port,
+        # so servers of several boards can share the output directory
+        namespace = path.basename(self.ser.port) if self.namespace == "port" else None
+        print(f"  Recording to: {path.join(self.manager.out_dir, namespace or '')}")
+        try:
+            self.serve_requests(framer, conn, namespace)
+        finally:
+            self.manager.remove_connection(conn)
+
+    def serve_requests(self, framer, conn, namespace):
         # Continuously read from the serial port in a blocking manner.
         while True:
             try:
@@ -432,28 +1062,189 @@ class sdsio_server_serial:
                 raise
                 # continue
 
-            if data:
-                buffer.extend(data)
-            else:
+            if not data:
                 continue
+            t_start = time.perf_counter()
+            conn.bytes_in += len(data)
+            framer.feed(data)
 
             # Process complete messages from the buffer.
-            # (Assuming that each message has at least a 16-byte header in which bytes [12:16] encode data_size.)
-            while len(buffer) >= 16:
-                header = buffer[:16]
-                data_size = int.from_bytes(header[12:16], 'little')
-                req_len = 16 + data_size
-                if len(buffer) < req_len:
-                    break  # Wait for more data.
-                request_buf = buffer[:req_len]
-                buffer = buffer[req_len:]
-                response = self.manager.execute_request(request_buf)
+            batched = 0
+            for request_buf in framer.requests():
+                response = self.manager.execute_request(request_buf, namespace)
                 if response:
                     try:
                         self.write(response)
                     except Exception as e:
                         print(f"Error during write: {e}")
-                        raise         
+                        raise
+                    conn.bytes_out += len(response)
+                batched += 1
+            # latency: from receiving the data until its requests are answered
+            if batched:
+                conn.requests += batched
+                conn.latency.add(time.perf_counter() - t_start, batched)
+
+# ---------------------------------------------------------------------------- #
+#                             Statistics Reporting                             #
+# ---------------------------------------------------------------------------- #
+
+
+def format_size(size):
+    for unit in ("B", "KB", "MB"):
+        if abs(size) < 1024:
+            return f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GB"
+
+
+# Print one line per open stream and connection every interval seconds,
+# with rates over the last interval, until stop is set
+def print_stats(manager: sdsio_manager, interval, stop):
+    last = {}
+    while not stop.wait(interval):
+        stats = manager.stats()
+        prev, last = last, {}
+        for st in stats["streams"]:
+            key = ("stream", st["sid"])
+            if st["mode"] == "write":
+                last[key] = (st["bytes_in"], st["writes"])
+                bytes_prev, count_prev = prev.get(key, (0, 0))
+                print(f"[stats] {st['name']}: in {format_size((st['bytes_in'] - bytes_prev) / interval)}/s, "
+                      f"{(st['writes'] - count_prev) / interval:.0f} writes/s, "
+                      f"backlog {format_size(st['backlog'])}, writer lag {format_size(st['writer_lag'])}, "
+                      f"stalled {st['stall_time']:.2f} s")
+            else:
+                last[key] = (st["bytes_out"], st["reads"])
+                bytes_prev, count_prev = prev.get(key, (0, 0))
+                print(f"[stats] {st['name']}: out {format_size((st['bytes_out'] - bytes_prev) / interval)}/s, "
+                      f"{(st['reads'] - count_prev) / interval:.0f} reads/s")
+        with manager.manager_lock:
+            connections = list(manager.connections)
+        for conn in connections:
+            key = ("connection", id(conn))
+            last[key] = (conn.bytes_in, conn.requests)
+            bytes_prev, count_prev = prev.get(key, (0, 0))
+            print(f"[stats] {conn.peer}: in {format_size((conn.bytes_in - bytes_prev) / interval)}/s, "
+                  f"{(conn.requests - count_prev) / interval:.0f} requests/s, "
+                  f"latency p50 {conn.latency.percentile(50)}, p99 {conn.latency.percentile(99)}")
+
+
+# Run server in a daemon thread, shut it down and close it once stop is set
+def serve_until(server, stop):
+    def shutdown():
+        stop.wait()
+        server.shutdown()
+        server.server_close()
+
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    threading.Thread(target=shutdown, daemon=True).start()
+
+
+# Serve manager.stats() as JSON on http://127.0.0.1:<port>/ until stop is set
+def serve_stats(manager: sdsio_manager, port, stop):
+    class StatsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = json.dumps(manager.stats()).encode('utf-8')
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), StatsHandler)
+    serve_until(server, stop)
+    print(f"Statistics available on http://127.0.0.1:{port}/")
+
+
+# Statistics are reported while the server runs, stop ends the reporting
+def start_stats(manager: sdsio_manager, interval, port, stop):
+    if interval:
+        threading.Thread(target=print_stats, args=(manager, interval, stop), daemon=True).start()
+    if port:
+        try:
+            serve_stats(manager, port, stop)
+        except OSError as e:
+            print(f"Statistics server not started: {e}")
+
+# ---------------------------------------------------------------------------- #
+#                                  Stream Tap                                  #
+# ---------------------------------------------------------------------------- #
+
+
+# Forward incoming stream data to TCP clients of 127.0.0.1:<port>. Events are
+# sent as SDSIO requests, as if the board talked to the client directly:
+# open (cmd 1, mode 1, name with namespace), write (cmd 3) and close (cmd 2).
+# Chunks dropped for a slow client are reported with a TAP_GAP_CMD message
+# carrying their number in the arg field.
+TAP_GAP_CMD = 0x100
+
+def serve_tap(manager: sdsio_manager, port, max_chunks, policy, stop):
+    class TapHandler(socketserver.BaseRequestHandler):
+        def watch(self, sub):
+            # tap clients only receive, end the feed once the client is gone
+            try:
+                while self.request.recv(4096):
+                    pass
+            except OSError:
+                pass
+            sub.close()
+
+        def handle(self):
+            peer = f"{self.client_address[0]}:{self.client_address[1]}"
+            sub = StreamSubscriber(max_chunks, policy, name=f"tap {peer}")
+            manager.subscribe(sub)
+            self.server.subscribers.add(sub)
+            threading.Thread(target=self.watch, args=(sub,), daemon=True).start()
+            print(f"Tap client connected: {peer}")
+            try:
+                while True:
+                    event = sub.get()
+                    if event is None:
+                        break
+                    kind, sid, name, data = event
+                    if kind == "open":
+                        cmd, arg, data = 1, 1, name.encode('utf-8') + b'\0'
+                    elif kind == "data":
+                        cmd, arg = 3, 0
+                    elif kind == "gap":
+                        # arg: number of chunks dropped at this point
+                        cmd, arg, data = TAP_GAP_CMD, data, b''
+                    else:
+                        cmd, arg, data = 2, 0, b''
+                    hdr = bytearray()
+                    hdr.extend(cmd.to_bytes(4, 'little'))
+                    hdr.extend(sid.to_bytes(4, 'little'))
+                    hdr.extend(arg.to_bytes(4, 'little'))
+                    hdr.extend(len(data).to_bytes(4, 'little'))
+                    self.request.sendall(hdr)
+                    if data:
+                        self.request.sendall(data)
+            except OSError:
+                pass
+            finally:
+                sub.close()
+                manager.unsubscribe(sub)
+                self.server.subscribers.discard(sub)
+                print(f"Tap client disconnected: {peer}, {sub.dropped} chunks dropped.")
+
+    class TapServer(socketserver.ThreadingTCPServer):
+        daemon_threads = True
+
+        def server_close(self):
+            # end the feeds of connected clients as well
+            super().server_close()
+            for sub in list(self.subscribers):
+                sub.close()
+
+    server = TapServer(("127.0.0.1", port), TapHandler)
+    server.subscribers = set()
+    serve_until(server, stop)
+    print(f"Stream tap listening on 127.0.0.1:{port}")
+
 
 # ---------------------------------------------------------------------------- #
 #                        Argument Parsing & Entry Point                        #
@@ -468,6 +1259,14 @@ def dir_path(out_dir):
             f"Invalid output directory: {out_dir}!")
 
 
+def fsync_policy(policy):
+    if policy in ("never", "close"):
+        return policy
+    if policy.isdigit() and int(policy) > 0:
+        return int(policy)
+    raise argparse.ArgumentTypeError(f"Invalid fsync policy: {policy}!")
+
+
 def ip_validator(ip_str):
     try:
         ipaddress.ip_address(ip_str)
@@ -490,6 +1289,29 @@ def interface_validator(interface):
         f"Invalid network interface: {interface}!")
 
 
+# Options of the stream handling shared by socket and serial server
+def add_manager_arguments(group):
+    group.add_argument("--fsync", dest="fsync_policy", metavar="<Policy>",
+                       help="Sync recordings to disk: never, close, or every <n> MB (default: never)",
+                       type=fsync_policy, default="never")
+    group.add_argument("--stats-interval", dest="stats_interval", metavar="<Seconds>",
+                       help="Print stream statistics every <Seconds> (default: 0 = off)",
+                       type=float, default=0)
+    group.add_argument("--stats-port", dest="stats_port", metavar="<HTTP Port>",
+                       help="Serve statistics as JSON on http://127.0.0.1:<HTTP Port>/ (default: off)",
+                       type=int, default=None)
+    group.add_argument("--tap-port", dest="tap_port", metavar="<TCP Port>",
+                       help="Forward incoming stream data live to clients of 127.0.0.1:<TCP Port> (default: off)",
+                       type=int, default=None)
+    group.add_argument("--tap-queue", dest="tap_queue", metavar="<Chunks>",
+                       help="Chunks queued per tap client before dropping (default: 1024)",
+                       type=int, default=1024)
+    group.add_argument("--tap-policy", dest="tap_policy", metavar="<Policy>",
+                       choices=["drop_old", "drop_new"],
+                       help="Full tap queue: drop_old or drop_new chunks (default: drop_old)",
+                       default="drop_old")
+
+
 def parse_arguments(argv=None):
     def formatter(prog): return argparse.HelpFormatter(
         prog, max_help_position=41)
@@ -512,6 +1334,12 @@ def parse_arguments(argv=None):
                               type=int, default=5050)
     socket_group.add_argument("--outdir", dest="out_dir", metavar="<Output dir>",
                               help="Output directory", type=dir_path, default=".")
+    socket_group.add_argument("--namespace", dest="namespace", metavar="<Namespace>",
+                              choices=["none", "peer"],
+                              help="Stream namespace: none = all streams in the output directory, or "
+                                   "peer = subdirectory per client IP (default: none)",
+                              default="none")
+    add_manager_arguments(socket_group)
 
     # Serial server arguments.
     parser_serial = subparsers.add_parser("serial", formatter_class=formatter)
@@ -537,6 +1365,12 @@ def parse_arguments(argv=None):
                                  type=float, default=60)
     serial_optional.add_argument("--outdir", dest="out_dir", metavar="<Output dir>",
                                  help="Output directory", type=dir_path, default=".")
+    serial_optional.add_argument("--namespace", dest="namespace", metavar="<Namespace>",
+                                 choices=["none", "port"],
+                                 help="Stream namespace: none = all streams in the output directory, or "
+                                      "port = subdirectory named after the serial port (default: none)",
+                                 default="none")
+    add_manager_arguments(serial_optional)
 
     return parser.parse_args(argv)
 
@@ -544,7 +1378,22 @@ def parse_arguments(argv=None):
 async def main(argv=None):
     
     args = parse_arguments(argv)
-    mgr = sdsio_manager(args.out_dir)
+    mgr = sdsio_manager(args.out_dir, args.fsync_policy)
+    # statistics and tap end with the server, e.g. before the GUI restarts it
+    stop = threading.Event()
+    try:
+        await run_server(args, mgr, stop)
+    finally:
+        stop.set()
+
+
+async def run_server(args, mgr: sdsio_manager, stop):
+    start_stats(mgr, args.stats_interval, args.stats_port, stop)
+    if args.tap_port:
+        try:
+            serve_tap(mgr, args.tap_port, args.tap_queue, args.tap_policy, stop)
+        except OSError as e:
+            print(f"Stream tap not started: {e}")
     if args.server_type == "socket":
         ip = args.ip
         if not ip and args.interface:
@@ -563,12 +1412,12 @@ async def main(argv=None):
         if not ip:
             ip = socket.gethostbyname(socket.gethostname())
         from asyncio import start_server
-        server = async_sdsio_server_socket(ip, args.port, mgr)
+        server = async_sdsio_server_socket(ip, args.port, mgr, args.namespace)
         await server.start()
     else:
         srv = sdsio_server_serial(
             args.port, args.baudrate, args.parity,
-            args.stop_bits, args.connect_timeout, mgr
+            args.stop_bits, args.connect_timeout, mgr, args.namespace
         )
         try:
             srv.start()